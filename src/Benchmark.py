@@ -0,0 +1,308 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+import numpy as np
+import polars as pl
+from FakeLLM import FakeLLM
+from FakeEmbedding import FakeEmbedding
+from GraphRAG import GraphRAG
+from Instrumentation import instrumentation
+from OllamaStub import OllamaStub
+from LLMPool import LLMPool
+from LLMScheduler import LLMScheduler
+from ExtractionParser import ExtractionParser
+from GraphRAGExtractor import GraphRAGExtractor
+
+"""
+Offline benchmark suite: runs every stage of the pipeline against a synthetic arXiv-like corpus,
+the deterministic FakeLLM / FakeEmbedding and the in-memory graph store, so no Ollama or Neo4j is
+needed. For every corpus size it measures
+- GraphRAG ingestion end to end (extraction, embedding, insertion and communities),
+- GraphRAGExtractor throughput, LLM calls and prompt size over the corpus chunks,
+- optionally, extraction throughput through an LLMPool of 1, 2, ... stub Ollama servers,
+- GraphRAG.parse_fn speed on extraction responses,
+- build_communities time and peak Python memory,
+- GraphRAGQueryEngine.custom_query latency percentiles,
+and writes the results as JSON, optionally printing the change against a previous results file.
+
+Usage: python src/Benchmark.py -s 10 50 200 -o benchmark_results.json [--baseline old.json]
+"""
+
+TOPICS = {
+    "cs.CL": ["Transformer", "BERT", "GPT", "Tokenizer", "Attention", "Summarization", "SQuAD", "BLEU", "Translation", "Parsing"],
+    "cs.LG": ["Dropout", "Adam", "ResNet", "Backpropagation", "Regularization", "ImageNet", "Boosting", "Kernel", "Gradient", "Ensemble"],
+    "cs.CV": ["Convolution", "Segmentation", "COCO", "YOLO", "Diffusion", "ViT", "Detection", "Augmentation", "GAN", "Pooling"],
+    "cs.IR": ["Retrieval", "BM25", "Reranker", "MSMARCO", "Embedding", "Index", "Recall", "Query", "Clustering", "GraphRAG"],
+}
+FILLER = (
+    "we propose a novel approach", "experiments show consistent gains", "compared to strong baselines",
+    "at a fraction of the cost", "across several benchmarks", "we analyse the failure modes",
+)
+
+
+def synthetic_corpus(size, seed=0):
+    """A DataFrame of size arXiv-like papers (id, title, abstract, categories) built from topic vocabularies."""
+    rng = random.Random(seed)
+    # Numbered variants of every term ("BERT-3"), so the number of distinct entities grows with the corpus
+    variants = max(1, size // 20)
+    shared = [term for terms in TOPICS.values() for term in terms[:2]]
+    rows = []
+    for i in range(size):
+        category = rng.choice(list(TOPICS))
+        vocabulary = TOPICS[category] + shared
+        terms = list(dict.fromkeys(
+            f"{term}-{rng.randrange(variants)}" if variants > 1 else term
+            for term in rng.sample(vocabulary, rng.randint(4, 8))
+        ))
+        sentences = [
+            f"{rng.choice(FILLER).capitalize()} using {a} with {b}." for a, b in zip(terms, terms[1:])
+        ]
+        rows.append({
+            "id": f"{2400 + i // 10000}.{i % 10000:05d}",
+            "title": f"{terms[0]} for {terms[-1]}",
+            "abstract": " ".join(sentences),
+            "categories": category,
+        })
+    return pl.DataFrame(rows)
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the pipeline's progress output while it is being timed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_ingestion(corpus_path, size, workdir, latency, batch_tokens):
+    start = time.perf_counter()
+    with quiet():
+        graph_rag = GraphRAG(
+            corpus_path, size, "benchmark", FakeLLM(latency=latency), FakeEmbedding(),
+            cache_path=None,
+            embedding_cache_dir=None,
+            checkpoint_path=os.path.join(workdir, "checkpoint.json"),
+            resume=False,
+            backend="memory",
+            snapshot_path=None,
+            extraction_batch_tokens=batch_tokens,
+        )
+    elapsed = time.perf_counter() - start
+    graph = graph_rag.graph_store.get_compact_graph()
+    return graph_rag, {
+        "seconds": elapsed,
+        "papers_per_sec": size / elapsed,
+        "entities": graph.num_nodes,
+        "relationships": graph.num_edges,
+        "communities": len(graph_rag.graph_store.community_summary),
+    }
+
+
+def bench_extractor(graph_rag, papers):
+    with quiet():
+        nodes = graph_rag.create_nodes(papers)
+        instrumentation.reset()
+        instrumentation.enable()
+        start = time.perf_counter()
+        graph_rag.kg_extractor(nodes)
+        elapsed = time.perf_counter() - start
+        instrumentation.disable()
+    counters = {counter["name"]: counter["value"] for counter in instrumentation.snapshot()["counters"]}
+    return {
+        "chunks": len(nodes),
+        "seconds": elapsed,
+        "chunks_per_sec": len(nodes) / elapsed,
+        "llm_calls": counters.get("llm_calls", 0),
+        "prompt_chars": counters.get("llm_prompt_chars", 0),
+    }
+
+
+def bench_endpoints(graph_rag, papers, endpoint_counts, latency, workers_per_endpoint=2):
+    """Extraction throughput over stub Ollama servers (latency seconds per request, one at a time) for each pool size."""
+    with quiet():
+        nodes = graph_rag.create_nodes(papers)
+    stubs = [OllamaStub(latency=latency).start() for _ in range(max(endpoint_counts))]
+    results = {}
+    try:
+        for count in endpoint_counts:
+            pool = LLMPool.from_endpoints("fake-llm", [stub.url for stub in stubs[:count]])
+            workers = workers_per_endpoint * count
+            scheduler = LLMScheduler(max_concurrency=workers, initial_concurrency=workers)
+            extractor = GraphRAGExtractor(
+                llm=scheduler.wrap(pool, LLMScheduler.EXTRACTION),
+                extract_prompt=graph_rag.KG_TRIPLET_EXTRACT_TMPL,
+                max_paths_per_chunk=20,
+                num_workers=workers,
+                parse_fn=graph_rag.parse_fn,
+                stream_parser=ExtractionParser,
+            )
+            with quiet():
+                start = time.perf_counter()
+                extractor([node.model_copy(deep=True) for node in nodes])
+                elapsed = time.perf_counter() - start
+            results[f"extractor_{count}_endpoints"] = {"chunks": len(nodes), "seconds": elapsed, "chunks_per_sec": len(nodes) / elapsed}
+    finally:
+        for stub in stubs:
+            stub.stop()
+    return results
+
+
+def bench_parse_fn(graph_rag, papers, repeat):
+    with quiet():
+        nodes = graph_rag.create_nodes(papers)
+    responses = [
+        graph_rag.llm.respond(graph_rag.kg_extractor.extract_prompt.format(text=node.text, max_knowledge_triplets=20))
+        for node in nodes
+    ]
+    with quiet():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for response in responses:
+                graph_rag.parse_fn(response)
+        elapsed = time.perf_counter() - start
+    calls = len(responses) * repeat
+    return {"calls": calls, "seconds": elapsed, "us_per_call": elapsed / calls * 1e6}
+
+
+def bench_build_communities(graph_rag):
+    store = graph_rag.graph_store
+    with quiet():
+        start = time.perf_counter()
+        store.build_communities()
+        elapsed = time.perf_counter() - start
+        # Separate run for memory, since tracemalloc slows allocation-heavy code down
+        tracemalloc.start()
+        store.build_communities()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"seconds": elapsed, "peak_memory_mb": peak / 2**20, "communities": len(store.community_summary)}
+
+
+def bench_queries(graph_rag, num_queries, seed=0):
+    rng = random.Random(seed)
+    terms = [term for vocabulary in TOPICS.values() for term in vocabulary]
+    queries = [f"How does {a} relate to {b}?" for a, b in (rng.sample(terms, 2) for _ in range(num_queries))]
+    engine = graph_rag.query_engine
+    # Measure the full query path, not the semantic cache
+    query_cache, engine.query_cache = engine.query_cache, None
+    latencies = []
+    with quiet():
+        for query in queries:
+            start = time.perf_counter()
+            engine.custom_query(query)
+            latencies.append(time.perf_counter() - start)
+    engine.query_cache = query_cache
+    return {"queries": num_queries, **percentiles(latencies)}
+
+
+def run(sizes, latency, num_queries, parse_repeat, seed, batch_tokens, endpoint_counts):
+    results = {}
+    for size in sizes:
+        print(f"Benchmarking corpus of {size} papers...")
+        papers = synthetic_corpus(size, seed)
+        with tempfile.TemporaryDirectory() as workdir:
+            corpus_path = os.path.join(workdir, "corpus.json")
+            papers.write_ndjson(corpus_path)
+            cwd = os.getcwd()
+            # GraphRAG writes community_graph.html to the working directory
+            os.chdir(workdir)
+            try:
+                graph_rag, ingestion = bench_ingestion(corpus_path, size, workdir, latency, batch_tokens)
+                results[str(size)] = {
+                    "ingestion": ingestion,
+                    "extractor": bench_extractor(graph_rag, papers.select("id", "title", "abstract")),
+                    "parse_fn": bench_parse_fn(graph_rag, papers.select("id", "title", "abstract"), parse_repeat),
+                    "build_communities": bench_build_communities(graph_rag),
+                    "query": bench_queries(graph_rag, num_queries, seed),
+                }
+                if endpoint_counts:
+                    results[str(size)].update(bench_endpoints(
+                        graph_rag, papers.select("id", "title", "abstract"), endpoint_counts, latency or 0.05
+                    ))
+            finally:
+                os.chdir(cwd)
+        for stage, metrics in results[str(size)].items():
+            print(f"  {stage}: " + ", ".join(f"{k}={v:.4g}" for k, v in metrics.items()))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print every metric next to its value in a baseline results file."""
+    print(f"Compared to {baseline['git_commit']} ({baseline['timestamp']}):")
+    for size, stages in results["results"].items():
+        for stage, metrics in stages.items():
+            old_metrics = baseline["results"].get(size, {}).get(stage, {})
+            for name, value in metrics.items():
+                old = old_metrics.get(name)
+                if old:
+                    print(f"  {size} {stage}.{name}: {old:.4g} -> {value:.4g} ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline GraphRAG benchmarks with a fake LLM and an in-memory graph store')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10, 50, 200],
+                      help='Corpus sizes (number of papers) to benchmark')
+    parser.add_argument('-o', '--output', type=str, default="benchmark_results.json",
+                      help='Path of the JSON results file')
+    parser.add_argument('--latency', type=float, default=0.0,
+                      help='Simulated seconds per FakeLLM call')
+    parser.add_argument('-q', '--queries', type=int, default=50,
+                      help='Number of queries used for the latency percentiles')
+    parser.add_argument('--parse-repeat', type=int, default=20,
+                      help='Times every extraction response is parsed in the parse_fn benchmark')
+    parser.add_argument('--batch-tokens', type=int, default=0,
+                      help='Estimated tokens per batched extraction prompt (0 extracts chunks one by one)')
+    parser.add_argument('--endpoints', type=int, nargs='+', default=None,
+                      help='Also measure extraction through pools of this many stub Ollama servers (e.g. 1 2 4)')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Seed of the synthetic corpus and queries')
+    parser.add_argument('--baseline', type=str, default=None,
+                      help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": run(args.sizes, args.latency, args.queries, args.parse_repeat, args.seed, args.batch_tokens, args.endpoints),
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import threading
+import numpy as np
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from Instrumentation import instrumentation
+
+"""
+Persistent, batched embedding layer wrapped around another embedding model (HuggingFaceEmbedding).
+Embeddings are keyed by (model name, text hash) and stored on disk as a memory-mapped float32 matrix,
+one row per text, next to a key index file listing the hash of every row in order. Only texts that
+are not in the cache are embedded, in batches of worker_batch_size spread over num_workers threads,
+so rebuilding the index over an unchanged corpus runs no embedding inference at all.
+"""
+class CachedEmbedding(BaseEmbedding):
+    embed_model: BaseEmbedding = Field(description="The embedding model whose outputs are cached.")
+    cache_dir: str = Field(default="cache/embeddings", description="Directory holding one cache per model.")
+    worker_batch_size: int = Field(default=64, description="Texts embedded per job on the worker pool.")
+
+    _lock = PrivateAttr()
+    _executor = PrivateAttr(default=None)
+    _path = PrivateAttr()
+    _rows = PrivateAttr()
+    _vectors = PrivateAttr(default=None)
+    _hits = PrivateAttr(default=0)
+    _misses = PrivateAttr(default=0)
+
+    def __init__(self, embed_model, cache_dir="cache/embeddings", num_workers=4, worker_batch_size=64, **kwargs):
+        super().__init__(
+            embed_model=embed_model,
+            cache_dir=cache_dir,
+            worker_batch_size=worker_batch_size,
+            num_workers=num_workers,
+            model_name=embed_model.model_name,
+            # Let whole index batches through, so they can be split across the worker pool
+            embed_batch_size=kwargs.pop("embed_batch_size", 2048),
+            **kwargs,
+        )
+        self._lock = threading.Lock()
+        self._path = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", embed_model.model_name))
+        os.makedirs(self._path, exist_ok=True)
+        # Text hash -> row of the vectors matrix
+        self._rows = {}
+        keys_path = os.path.join(self._path, "keys.txt")
+        if os.path.exists(keys_path):
+            with open(keys_path, "r", encoding="utf-8") as f:
+                for row, key in enumerate(f.read().split()):
+                    self._rows[key] = row
+        meta_path = os.path.join(self._path, "meta.json")
+        if self._rows and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self._open_vectors(json.load(f)["dim"])
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    def _key(self, kind, text):
+        digest = hashlib.sha256()
+        for part in (self.model_name, kind, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def _open_vectors(self, dim, capacity=None):
+        """Map the vectors file with room for at least capacity rows, growing the file if needed."""
+        vectors_path = os.path.join(self._path, "vectors.f32")
+        row_bytes = dim * np.dtype(np.float32).itemsize
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        if capacity is not None and size < capacity * row_bytes:
+            if self._vectors is not None:
+                self._vectors.flush()
+            with open(vectors_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            size = capacity * row_bytes
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(size // row_bytes, dim))
+
+    def _store(self, keys, embeddings):
+        """Append new rows to the matrix first, then their keys, so the key index never points at missing rows."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            new = [(key, embedding) for key, embedding in zip(keys, embeddings) if key not in self._rows]
+            if not new:
+                return
+            start = len(self._rows)
+            if self._vectors is None:
+                with open(os.path.join(self._path, "meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": embeddings.shape[1]}, f)
+                self._open_vectors(embeddings.shape[1], capacity=max(1024, len(new)))
+            elif start + len(new) > len(self._vectors):
+                self._open_vectors(self._vectors.shape[1], capacity=max(start + len(new), 2 * len(self._vectors)))
+            self._vectors[start:start + len(new)] = np.stack([embedding for _, embedding in new])
+            self._vectors.flush()
+            with open(os.path.join(self._path, "keys.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(key + "\n" for key, _ in new))
+            for offset, (key, _) in enumerate(new):
+                self._rows[key] = start + offset
+
+    def _lookup(self, keys):
+        """Cached embeddings for the keys, with None for misses."""
+        with self._lock:
+            rows = [self._rows.get(key) for key in keys]
+            return [None if row is None else self._vectors[row].tolist() for row in rows]
+
+    def _embed_missing(self, texts):
+        """Embed the texts on the worker pool, worker_batch_size texts per job."""
+        batches = [texts[i:i + self.worker_batch_size] for i in range(0, len(texts), self.worker_batch_size)]
+        if len(batches) == 1 or not self.num_workers or self.num_workers < 2:
+            return [embedding for batch in batches for embedding in self.embed_model._get_text_embeddings(batch)]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        results = self._executor.map(self.embed_model._get_text_embeddings, batches)
+        return [embedding for batch in results for embedding in batch]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("text", text) for text in texts]
+        embeddings = self._lookup(keys)
+        # Identical texts in the same batch are embedded once
+        missing = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                missing.setdefault(key, text)
+        self._hits += len(texts) - sum(embedding is None for embedding in embeddings)
+        self._misses += len(missing)
+
+        instrumentation.count("embedding_texts", len(texts) - len(missing), cached=True)
+        instrumentation.count("embedding_texts", len(missing), cached=False)
+        if missing:
+            with instrumentation.span("embedding"):
+                computed = self._embed_missing(list(missing.values()))
+            self._store(list(missing), computed)
+            computed = dict(zip(missing, computed))
+            embeddings = [
+                computed[key] if embedding is None else embedding
+                for key, embedding in zip(keys, embeddings)
+            ]
+        return [list(map(float, embedding)) for embedding in embeddings]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        # Query embeddings can differ from text embeddings (e.g. instruction prefixes), so they get their own keys
+        key = self._key("query", query)
+        embedding = self._lookup([key])[0]
+        if embedding is not None:
+            self._hits += 1
+            return embedding
+        self._misses += 1
+        embedding = self.embed_model._get_query_embedding(query)
+        self._store([key], [embedding])
+        return list(map(float, embedding))
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def reset_stats(self):
+        self._hits = 0
+        self._misses = 0
+
+    def report(self):
+        """Print the hit/miss counts collected since the last reset."""
+        total = self._hits + self._misses
+        hit_rate = (self._hits / total * 100) if total else 0.0
+        print(
+            f"Embedding cache: {self._hits} hits, {self._misses} misses "
+            f"({hit_rate:.1f}% hit rate), {len(self._rows)} embeddings stored in {self._path}"
+        )
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __bool__(self):
+        # An empty cache is still a model; llama_index falls back to its default one for falsy models
+        return True
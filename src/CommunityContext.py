@@ -0,0 +1,61 @@
+import numpy as np
+
+"""
+The edges that describe one community, built from a CompactGraph.
+Every relationship appears once even if both of its endpoints are in the community. Edges are
+ranked so that relationships inside the community come first, then by the combined degree of their
+endpoints, and the list is capped at max_edges. Only at prompt time is the context turned into text,
+stopping once the token budget is used up, so hubs with hundreds of edges cannot blow up the prompt.
+"""
+class CommunityContext():
+    # Rough characters-per-token ratio used to estimate prompt size without loading a tokenizer
+    chars_per_token = 4
+
+    def __init__(self, community_id, nodes, edge_ids):
+        self.community_id = community_id
+        self.nodes = nodes
+        self.edge_ids = edge_ids
+
+    @classmethod
+    def from_nodes(cls, community_id, graph, nodes, max_edges=None):
+        """Collect, deduplicate and rank the edges touching the given node ids of the graph."""
+        nodes = np.unique(np.asarray(nodes, dtype=np.int32))
+        if len(nodes) == 0:
+            return cls(community_id, nodes, np.empty(0, dtype=np.int32))
+
+        edge_ids = np.unique(np.concatenate([graph.incident_edges(node) for node in nodes]))
+        sources = graph.sources[edge_ids]
+        targets = graph.targets[edge_ids]
+        intra = np.isin(sources, nodes) & np.isin(targets, nodes)
+        degrees = graph.degrees()
+        combined_degree = degrees[sources] + degrees[targets]
+        # lexsort sorts by the last key first: intra-community edges, then higher combined degree
+        order = np.lexsort((-combined_degree, ~intra))
+        edge_ids = edge_ids[order]
+        if max_edges is not None:
+            edge_ids = edge_ids[:max_edges]
+        return cls(community_id, nodes, edge_ids)
+
+    def edges(self, graph):
+        """(source, target, relation) name tuples for the selected edges, in rank order."""
+        return [graph.edge(edge_id) for edge_id in self.edge_ids]
+
+    def to_lines(self, graph, descriptions, token_budget=None):
+        """
+        Format the ranked edges as "source -> target -> relation -> description" lines, stopping
+        before the estimated token count would exceed token_budget.
+        """
+        lines = []
+        used = 0
+        for source, target, relation in self.edges(graph):
+            description = descriptions.get((source, target, relation)) or "relationship_description_dummy"
+            line = f"{source} -> {target} -> {relation} -> {description}"
+            cost = len(line) // self.chars_per_token + 1
+            if token_budget is not None and lines and used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        return lines
+
+    def __len__(self):
+        return len(self.edge_ids)
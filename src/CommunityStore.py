@@ -0,0 +1,471 @@
+import re
+import asyncio
+import numpy as np
+import nest_asyncio
+from graspologic.partition import hierarchical_leiden
+from collections import defaultdict
+from llama_index.core.llms import ChatMessage
+from CompactGraph import CompactGraph
+from CommunityContext import CommunityContext
+from Instrumentation import instrumentation, message_chars
+
+nest_asyncio.apply()
+
+"""
+CITATION: 
+LlamaIndex Cookbook: GraphRAG Implementation with LlamaIndex - V2
+link: https://docs.llamaindex.ai/en/stable/examples/cookbooks/GraphRAG_v2/#graphragstore
+"""
+
+
+def normalize_entity_name(name):
+    """Case- and whitespace-insensitive form of an entity name, used as the entity index key."""
+    return re.sub(r"\s+", " ", str(name)).strip().strip("\"'").casefold()
+
+
+class CommunityStore():
+    """
+    Community detection and summarization shared by the graph store backends.
+    A backend only has to stream its entity relationships (_iter_edge_pages), look up relationship
+    descriptions (_fetch_edge_descriptions) and persist the communities (save_communities,
+    load_communities); everything else works on the CompactGraph materialized from it.
+    """
+    max_cluster_size = 5
+    # Number of edges per page when materializing the graph
+    edge_page_size = 10000
+    # Max number of ranked relationships considered for one community summary
+    max_context_edges = 200
+    # Approximate token budget for the relationships in one community summary prompt
+    community_token_budget = 3000
+
+    # Number of community summaries embedded per embedding model call
+    embed_batch_size = 64
+
+    def _init_communities(self, llm, summary_workers=4, summary_retries=2, embed_model=None):
+        self.llm = llm
+        # Embeds the community summaries so queries can rank communities; None skips the embeddings
+        self.embed_model = embed_model
+        # Max number of community summaries requested from the LLM at the same time
+        self.summary_workers = summary_workers
+        # Extra attempts per community before giving up on it
+        self.summary_retries = summary_retries
+        self.community_summary = {}
+        # Community id -> normalized float32 embedding of its summary
+        self.community_embedding = {}
+        self.entity_info = None
+        # Community id -> hierarchy level (0 is the coarsest) and parent community id (None at level 0)
+        self.community_level = {}
+        self.community_parent = {}
+        # Normalized entity name -> community ids, rebuilt whenever entity_info changes
+        self.entity_index = {}
+        # Bumped whenever the communities change, so caches built on top of them can be invalidated
+        self.community_version = 0
+        # Compact graph materialized from the backend, reused until the graph or communities change
+        self._compact_graph = None
+        # (community_version, community ids, id -> row, stacked embeddings) used by rank_communities
+        self._embedding_matrix = None
+        # Leiden community count of the graph before entity resolution merged anything, reported by build_communities
+        self._unresolved_community_count = None
+
+    def _community_summary_messages(self, text, from_children=False):
+        if from_children:
+            system_prompt = (
+                "You are provided with the summaries of several sub-communities of a knowledge graph, one per line. "
+                "Your task is to combine them into a single summary of the larger community they form. The summary should "
+                "include the names of the most important entities involved and a concise synthesis of how the sub-communities "
+                "relate to each other. Ensure that the summary is coherent and emphasizes the key aspects of the community."
+            )
+        else:
+            system_prompt = (
+                "You are provided with a set of relationships from a knowledge graph, each represented as "
+                "(relationship$$$$<source_entity>$$$$<target_entity>$$$$<relation>$$$$<relationship_description>)." 
+                "Your task is to create a summary of these relationships. The summary should include the names of the entities involved and a concise synthesis "
+                "of the relationship descriptions. The goal is to capture the most critical and relevant details that "
+                "highlight the nature and significance of each relationship. Ensure that the summary is coherent and "
+                "integrates the information in a way that emphasizes the key aspects of the relationships."
+            )
+        return [
+            ChatMessage(role="system", content=system_prompt),
+            ChatMessage(role="user", content=text),
+        ]
+
+    def generate_community_summary(self, text, from_children=False):
+        """Generate summary for a given text using an LLM."""
+        messages = self._community_summary_messages(text, from_children)
+        with instrumentation.llm_call("community_summary") as call:
+            call.prompt_chars = message_chars(messages)
+            response = self.llm.chat(messages)
+            call.response_chars = len(str(response))
+        clean_response = re.sub(r"^assistant:\s*", "", str(response)).strip()
+        return clean_response
+
+    async def agenerate_community_summary(self, text, from_children=False):
+        """Async version of generate_community_summary."""
+        messages = self._community_summary_messages(text, from_children)
+        with instrumentation.llm_call("community_summary") as call:
+            call.prompt_chars = message_chars(messages)
+            response = await self.llm.achat(messages)
+            call.response_chars = len(str(response))
+        clean_response = re.sub(r"^assistant:\s*", "", str(response)).strip()
+        return clean_response
+
+    def build_communities(self, level=None):
+        """
+        Builds communities from the graph and summarizes them.
+        hierarchical_leiden splits every community larger than max_cluster_size into sub-communities
+        one level down. With level=None all levels are summarized bottom-up, parents from their
+        children's summaries. With a level, only the communities making up that level are built
+        (see communities_at_level), each summarized straight from its edges.
+        """
+        with instrumentation.span("communities.export"):
+            graph = self.get_compact_graph(refresh=True)
+        if graph.num_edges == 0:
+            print("No relationships found in the graph, skipping community detection.")
+            return
+        with instrumentation.span("communities.leiden"):
+            community_hierarchical_clusters = hierarchical_leiden(
+                graph.adjacency, max_cluster_size=self.max_cluster_size
+            )
+        if self._unresolved_community_count is not None:
+            print(
+                f"Entity resolution: communities {self._unresolved_community_count} -> "
+                f"{len({item.cluster for item in community_hierarchical_clusters})}."
+            )
+            self._unresolved_community_count = None
+        self.community_level = {}
+        self.community_parent = {}
+        for item in community_hierarchical_clusters:
+            self.community_level[item.cluster] = item.level
+            self.community_parent[item.cluster] = item.parent_cluster
+        selected = self.communities_at_level(level)
+        self.community_level = {k: v for k, v in self.community_level.items() if k in selected}
+        self.community_parent = {k: v for k, v in self.community_parent.items() if k in selected}
+
+        self.entity_info, community_info = self._collect_community_info(
+            graph, [item for item in community_hierarchical_clusters if item.cluster in selected]
+        )
+        self._build_entity_index()
+        self.community_summary = {}
+        self.community_embedding = {}
+        with instrumentation.span("communities.summarize"):
+            self._summarize_communities(graph, community_info)
+        with instrumentation.span("communities.embed"):
+            self.embed_communities()
+        self.community_version += 1
+        with instrumentation.span("communities.save"):
+            self.save_communities()
+
+    def communities_at_level(self, level=None):
+        """
+        Ids of the communities that make up a hierarchy level: those at that level, plus the leaf
+        communities of coarser levels that were never split, so every entity is still covered.
+        level=None returns every community.
+        """
+        if level is None:
+            return set(self.community_level)
+        parents = {parent for parent in self.community_parent.values() if parent is not None}
+        return {
+            community_id
+            for community_id, community_level in self.community_level.items()
+            if community_level == level or (community_level < level and community_id not in parents)
+        }
+
+    def get_compact_graph(self, refresh=False):
+        """Returns the materialized CompactGraph, exporting it from the backend if needed (or if refresh is set)."""
+        if refresh or self._compact_graph is None:
+            self._compact_graph = CompactGraph.from_edge_pages(self._iter_edge_pages())
+            print(f"Materialized graph with {self._compact_graph.num_nodes} entities and {self._compact_graph.num_edges} relationships.")
+        return self._compact_graph
+
+    def _iter_edge_pages(self):
+        """Yield pages of (source, target, relation) tuples for every entity -> entity relationship."""
+        raise NotImplementedError
+
+    def _fetch_edge_descriptions(self, edges):
+        """Returns {(source, target, relation): relationship_description} for the given edges."""
+        raise NotImplementedError
+
+    def iter_entity_embeddings(self):
+        """Yield pages of (entity id, embedding) pairs for every embedded entity, e.g. to build a LocalVectorIndex."""
+        raise NotImplementedError
+
+    def resolve_entities(self, resolver):
+        """
+        Merge the entities an EntityResolver finds to be the same and drop placeholder entities, then
+        report how much the entity count shrank. The communities of the graph already exported here
+        are counted with one Leiden pass, and the next build_communities (which exports the merged
+        graph again) reports the community count against it.
+        """
+        graph = self.get_compact_graph(refresh=True)
+        if graph.num_edges == 0:
+            return
+        with instrumentation.span("entity_resolution.match"):
+            groups, dropped = resolver.resolve(graph.names, graph.degrees())
+        if not groups and not dropped:
+            print("Entity resolution: no duplicate entities found.")
+            return
+        with instrumentation.span("entity_resolution.count"):
+            self._unresolved_community_count = len({
+                item.cluster
+                for item in hierarchical_leiden(graph.adjacency, max_cluster_size=self.max_cluster_size)
+            })
+        with instrumentation.span("entity_resolution.merge"):
+            if dropped:
+                self.delete(ids=dropped)
+            if groups:
+                self._merge_entities(groups)
+        self._compact_graph = None
+        aliases = sum(len(group) for group in groups.values())
+        print(
+            f"Entity resolution: merged {aliases} names into {len(groups)} entities, dropped {len(dropped)} placeholders. "
+            f"Entities {graph.num_nodes} -> {graph.num_nodes - aliases - len(dropped)}."
+        )
+        instrumentation.count("entities_merged", aliases)
+
+    def _merge_entities(self, groups):
+        """Merge every alias entity into its canonical entity ({canonical name: [alias names]}), relations included."""
+        raise NotImplementedError
+
+    def _collect_community_info(self, graph, clusters):
+        """
+        Collect information for each node based on their community,
+        allowing entities to belong to multiple clusters.
+        Community info maps each cluster to the compact graph ids of its member nodes; the edges
+        are only ranked and turned into text if the community is summarized from them.
+        """
+        entity_info = defaultdict(set)
+        community_info = defaultdict(list)
+
+        for item in clusters:
+            node_id = int(item.node)
+            cluster_id = item.cluster
+
+            entity_info[graph.names[node_id]].add(cluster_id)
+            community_info[cluster_id].append(node_id)
+
+        entity_info = {k: list(v) for k, v in entity_info.items()}
+
+        return dict(entity_info), dict(community_info)
+
+    def _community_details(self, graph, community_id, nodes):
+        """Rank a community's edges, fetch their descriptions and format them within the token budget."""
+        with instrumentation.span("communities.context"):
+            context = CommunityContext.from_nodes(
+                community_id, graph, nodes, max_edges=self.max_context_edges
+            )
+            descriptions = self._fetch_edge_descriptions(context.edges(graph))
+        return context.to_lines(graph, descriptions, self.community_token_budget)
+
+    def _children_details(self, children):
+        """Summaries of already summarized child communities, within the token budget."""
+        lines = []
+        budget = self.community_token_budget * CommunityContext.chars_per_token
+        for child in children:
+            summary = self.community_summary[child]
+            if lines and len(summary) > budget:
+                break
+            lines.append(summary)
+            budget -= len(summary)
+        return lines
+
+    def _summarize_communities(self, graph, community_info):
+        """Generate and store summaries for each community."""
+        return asyncio.run(self._asummarize_communities(graph, community_info))
+
+    async def _asummarize_communities(self, graph, community_info):
+        """
+        Summarize communities concurrently, with at most summary_workers LLM calls in flight.
+        Levels are processed from the finest to the coarsest, so a parent community is summarized
+        from its children's summaries instead of re-reading all of its edges. Each community is
+        retried with exponential backoff; communities that still fail are reported and skipped so
+        that a single bad response does not abort build_communities().
+        """
+        semaphore = asyncio.Semaphore(self.summary_workers)
+        total = len(community_info)
+        report_every = max(1, total // 20)
+        progress = {"done": 0}
+        failed = []
+        children = defaultdict(list)
+        for community_id in community_info:
+            parent = self.community_parent.get(community_id)
+            if parent is not None:
+                children[parent].append(community_id)
+
+        async def summarize(community_id, nodes):
+            details_text = None
+            from_children = False
+            for attempt in range(self.summary_retries + 1):
+                try:
+                    async with semaphore:
+                        if details_text is None:
+                            summarized_children = [
+                                child for child in children[community_id] if child in self.community_summary
+                            ]
+                            if summarized_children:
+                                from_children = True
+                                details = self._children_details(summarized_children)
+                            else:
+                                # Edge descriptions are only fetched now, right before the LLM needs them
+                                details = await asyncio.to_thread(
+                                    self._community_details, graph, community_id, nodes
+                                )
+                            details_text = (
+                                "\n".join(details) + "."
+                            )
+                        summary = await self.agenerate_community_summary(details_text, from_children)
+                    self.community_summary[community_id] = summary
+                    break
+                except Exception as e:
+                    if attempt == self.summary_retries:
+                        print(f"Failed to summarize community {community_id}: {e}")
+                        failed.append(community_id)
+                    else:
+                        await asyncio.sleep(2 ** attempt)
+
+            progress["done"] += 1
+            if progress["done"] % report_every == 0 or progress["done"] == total:
+                print(f"Summarized {progress['done']}/{total} communities ({len(failed)} failed)")
+
+        levels = sorted({self.community_level.get(community_id, 0) for community_id in community_info}, reverse=True)
+        for level in levels:
+            await asyncio.gather(
+                *(
+                    summarize(community_id, nodes)
+                    for community_id, nodes in community_info.items()
+                    if self.community_level.get(community_id, 0) == level
+                )
+            )
+        return failed
+
+    def embed_communities(self):
+        """
+        Embed the summaries of the communities that have no embedding yet, in batches. Returns the
+        number of summaries embedded (0 without an embedding model).
+        """
+        if self.embed_model is None:
+            return 0
+        missing = [community_id for community_id in self.community_summary if community_id not in self.community_embedding]
+        for start in range(0, len(missing), self.embed_batch_size):
+            batch = missing[start:start + self.embed_batch_size]
+            embeddings = np.asarray(
+                self.embed_model.get_text_embedding_batch([self.community_summary[community_id] for community_id in batch]),
+                dtype=np.float32,
+            )
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.community_embedding.update(zip(batch, embeddings / norms))
+        if missing:
+            self._embedding_matrix = None
+            print(f"Embedded {len(missing)} community summaries.")
+        return len(missing)
+
+    def rank_communities(self, query_embedding, community_ids=None, top_n=None, threshold=None):
+        """
+        Rank communities by the cosine similarity of their summary embedding to the query embedding.
+        Returns [(community id, score)] best first, restricted to community_ids if given (all embedded
+        communities otherwise), to scores of at least threshold and to the top_n best.
+        """
+        if self._embedding_matrix is None or self._embedding_matrix[0] != self.community_version:
+            ids = list(self.community_embedding)
+            matrix = np.stack([self.community_embedding[id] for id in ids]) if ids else np.zeros((0, 0), dtype=np.float32)
+            self._embedding_matrix = (self.community_version, ids, {id: row for row, id in enumerate(ids)}, matrix)
+        _, ids, rows, matrix = self._embedding_matrix
+        if not ids:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        if community_ids is None:
+            candidate_rows = np.arange(len(ids))
+        else:
+            candidate_rows = np.array([rows[id] for id in community_ids if id in rows], dtype=np.int64)
+        if not len(candidate_rows):
+            return []
+        scores = matrix[candidate_rows] @ query
+        keep = np.arange(len(scores)) if threshold is None else np.flatnonzero(scores >= threshold)
+        if top_n is not None and len(keep) > top_n:
+            keep = keep[np.argpartition(-scores[keep], top_n - 1)[:top_n]]
+        keep = keep[np.argsort(-scores[keep], kind="stable")]
+        return [(ids[candidate_rows[i]], float(scores[i])) for i in keep]
+
+    def has_graph(self):
+        """Returns True if the store already contains extracted entities."""
+        raise NotImplementedError
+
+    def save_communities(self):
+        """Persist the communities next to the graph, replacing any previously saved ones."""
+        raise NotImplementedError
+
+    def load_communities(self):
+        """Reload the communities saved by save_communities. Returns True if any were found."""
+        raise NotImplementedError
+
+    def _community_rows(self):
+        """
+        One row per summarized community with its summary, its place in the hierarchy and the names
+        of its member entities, as written by save_communities.
+        """
+        members = defaultdict(list)
+        for entity, community_ids in (self.entity_info or {}).items():
+            for community_id in community_ids:
+                members[community_id].append(entity)
+
+        return [
+            {
+                "id": community_id,
+                "summary": summary,
+                "level": self.community_level.get(community_id, 0),
+                "parent": self.community_parent.get(community_id),
+                "entities": members.get(community_id, []),
+                "embedding": self.community_embedding[community_id].tolist() if community_id in self.community_embedding else None,
+            }
+            for community_id, summary in self.community_summary.items()
+        ]
+
+    def _restore_communities(self, records):
+        """Rebuild the community state from rows produced by _community_rows. Returns True if any were given."""
+        if not records:
+            return False
+
+        community_summary = {}
+        community_level = {}
+        community_parent = {}
+        community_embedding = {}
+        entity_info = defaultdict(set)
+        for record in records:
+            community_summary[record["id"]] = record["summary"]
+            community_level[record["id"]] = record["level"] or 0
+            community_parent[record["id"]] = record["parent"]
+            if record.get("embedding"):
+                community_embedding[record["id"]] = np.asarray(record["embedding"], dtype=np.float32)
+            for entity in record["entities"] or []:
+                entity_info[entity].add(record["id"])
+
+        self.community_summary = community_summary
+        self.community_level = community_level
+        self.community_parent = community_parent
+        self.community_embedding = community_embedding
+        self.entity_info = {k: list(v) for k, v in entity_info.items()}
+        self._build_entity_index()
+        self.community_version += 1
+        return True
+
+    def flush(self):
+        """Make every pending write visible to reads. Nothing to do for unbuffered backends."""
+
+    def report_upserts(self):
+        """Print write throughput statistics, if the backend collects any."""
+
+    def _build_entity_index(self):
+        """Build the normalized entity name -> community ids inverted index from entity_info."""
+        entity_index = defaultdict(set)
+        for entity, community_ids in (self.entity_info or {}).items():
+            entity_index[normalize_entity_name(entity)].update(community_ids)
+        self.entity_index = {k: list(v) for k, v in entity_index.items()}
+
+    def get_community_summaries(self):
+        """Returns the community summaries, building them if not already done."""
+        if not self.community_summary:
+            self.build_communities()
+        return self.community_summary
@@ -0,0 +1,106 @@
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+from array import array
+
+"""
+Compact, integer-id view of the entity graph used for community detection.
+Entity names are interned once, edges are kept as parallel int32 arrays (source, target, relation
+label id), and the undirected adjacency is a CSR matrix that hierarchical_leiden accepts directly.
+Edge descriptions are deliberately not stored; they are fetched only when a community is summarized.
+"""
+class CompactGraph():
+
+    def __init__(self, names, sources, targets, relations, relation_labels):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.sources = sources
+        self.targets = targets
+        self.relations = relations
+        self.relation_labels = relation_labels
+
+        n = len(names)
+        # Symmetric 0/1 adjacency, parallel edges collapsed, like the undirected nx.Graph it replaces
+        adjacency = sp.coo_array(
+            (np.ones(len(sources), dtype=np.float64), (sources, targets)), shape=(n, n)
+        ).tocsr()
+        adjacency = (adjacency + adjacency.T).tocsr()
+        adjacency.data[:] = 1.0
+        self.adjacency = adjacency
+
+        # Edge ids incident to each node, as a CSR-style (indptr, edge ids) pair
+        endpoints = np.concatenate([sources, targets])
+        edge_ids = np.concatenate([np.arange(len(sources), dtype=np.int32)] * 2)
+        order = np.argsort(endpoints, kind="stable")
+        self._incident_edges = edge_ids[order]
+        self._incident_indptr = np.searchsorted(endpoints[order], np.arange(n + 1))
+
+    @classmethod
+    def from_edge_pages(cls, pages):
+        """Build the graph from an iterable of pages, each a list of (source, target, relation) name tuples."""
+        index = {}
+        names = []
+        relation_index = {}
+        relation_labels = []
+        sources, targets, relations = array("i"), array("i"), array("i")
+
+        def intern(value, lookup, values):
+            value_id = lookup.get(value)
+            if value_id is None:
+                value_id = lookup[value] = len(values)
+                values.append(value)
+            return value_id
+
+        for page in pages:
+            for source, target, relation in page:
+                sources.append(intern(source, index, names))
+                targets.append(intern(target, index, names))
+                relations.append(intern(relation, relation_index, relation_labels))
+
+        # Drop repeated (source, target, relation) rows so every relationship is a single edge
+        triples = np.stack([
+            np.frombuffer(sources, dtype=np.int32),
+            np.frombuffer(targets, dtype=np.int32),
+            np.frombuffer(relations, dtype=np.int32),
+        ], axis=1)
+        triples = np.unique(triples, axis=0) if len(triples) else triples
+        return cls(
+            names,
+            np.ascontiguousarray(triples[:, 0]),
+            np.ascontiguousarray(triples[:, 1]),
+            np.ascontiguousarray(triples[:, 2]),
+            relation_labels,
+        )
+
+    @property
+    def num_nodes(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.sources)
+
+    def degrees(self):
+        """Number of distinct neighbours of every node."""
+        return np.diff(self.adjacency.indptr)
+
+    def incident_edges(self, node_id):
+        """Ids of the edges that start or end at node_id."""
+        return self._incident_edges[self._incident_indptr[node_id]:self._incident_indptr[node_id + 1]]
+
+    def edge(self, edge_id):
+        """Returns (source name, target name, relation label) for an edge id."""
+        return (
+            self.names[self.sources[edge_id]],
+            self.names[self.targets[edge_id]],
+            self.relation_labels[self.relations[edge_id]],
+        )
+
+    def to_nx(self):
+        """NetworkX version of the graph, for visualization."""
+        nx_graph = nx.Graph()
+        nx_graph.add_nodes_from(self.names)
+        for edge_id in range(self.num_edges):
+            source, target, relation = self.edge(edge_id)
+            nx_graph.add_edge(source, target, relationship=relation)
+        return nx_graph
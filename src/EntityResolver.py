@@ -0,0 +1,237 @@
+import re
+import numpy as np
+import scipy.sparse as sp
+from collections import defaultdict
+
+"""
+Entity resolution for the extracted graph: finds names the LLM wrote differently for the same
+entity ("BERT", "Bert", "the BERT model", "neural networks") so the store can merge them.
+1. Names are canonicalized (case, punctuation, leading articles, regular plural of the last word of
+   a phrase); names with the same canonical form are merged directly. Symbols that tell names
+   apart ("C++", "C#", "A*", ".NET") are kept.
+2. The remaining canonical forms are grouped by cheap blocking keys (without a generic head word like
+   "model", sorted tokens, a short prefix), so only names sharing a key are ever compared.
+3. Within each block, pairs are confirmed with a vectorized cosine similarity of character trigrams
+   and, if an embedding model is given, of the names' embeddings.
+Merges cannot be undone, so a pair is never merged when the names differ in a number ("ResNet-50",
+"ResNet-101", "YOLOv5"), in an extra word ("Transformer-XL"), in a short token, or only by a
+trailing "s" that canonicalization did not treat as a plural ("pandas").
+The placeholder entities the old extraction parser inserted for malformed responses are dropped.
+"""
+class EntityResolver():
+    ARTICLES = {"the", "a", "an"}
+    # Head words that are often appended to a name ("BERT model"); only used as a blocking key
+    GENERIC_HEADS = {"model", "method", "approach", "algorithm", "framework", "technique", "architecture", "system"}
+    # Words ending in s that are not plurals
+    SINGULAR_S = {"series", "species", "analysis", "bias", "class", "loss", "gas", "lens", "news"}
+    # Acronym plurals such as "CNNs" or "LLMs"
+    ACRONYM_PLURAL = re.compile(r"[A-Z][A-Z0-9]+s")
+    # Words, with the symbols that distinguish names: a leading dot (".NET") and trailing +, # or * ("C++", "C#", "A*")
+    WORD = re.compile(r"(?:(?<!\w)\.)?[^\W_]+[+#*]*")
+    DUMMY_NAMES = {"DummyEntityName", "DummyRelationshipSourceEntity", "DummyRelationshipTargetEntity"}
+    prefix_length = 5
+
+    def __init__(
+            self,
+            embed_model=None,
+            name_threshold=0.85,
+            embedding_threshold=0.9,
+            min_name_similarity=0.5,
+            max_block_size=500,
+        ):
+        # Without embeddings, canonical forms must reach name_threshold trigram similarity to merge;
+        # with them, embedding_threshold embedding similarity and min_name_similarity trigram similarity
+        self.embed_model = embed_model
+        self.name_threshold = name_threshold
+        self.embedding_threshold = embedding_threshold
+        self.min_name_similarity = min_name_similarity
+        # Larger blocks (very common prefixes) are skipped, to keep the comparisons bounded
+        self.max_block_size = max_block_size
+
+    @classmethod
+    def _singular(cls, word, alone=False):
+        """
+        Singular of a plural last word. Only known plural patterns are reduced: acronym plurals and
+        regular plurals of the last word of a phrase ("neural networks"). A word standing alone
+        (alone=True) is more likely a name ("pandas", "Transformers") and only loses an acronym plural.
+        """
+        if cls.ACRONYM_PLURAL.fullmatch(word):
+            return word[:-1]
+        if alone or not (word.islower() or word.istitle()):
+            return word
+        word = word.casefold()
+        if len(word) <= 3 or word in cls.SINGULAR_S or word.endswith(("ss", "us", "is")):
+            return word
+        if word.endswith(("yses", "theses")):
+            return word[:-2] + "is"
+        if word.endswith("ies") and len(word) > 4:
+            return word[:-3] + "y"
+        if word.endswith(("sses", "xes", "ches", "shes")):
+            return word[:-2]
+        if word.endswith("s"):
+            return word[:-1]
+        return word
+
+    @classmethod
+    def canonicalize(cls, name):
+        """Canonical form of an entity name: lowercase words without separators, leading articles or a plural ending."""
+        words = cls.WORD.findall(str(name))
+        while len(words) > 1 and words[0].casefold() in cls.ARTICLES:
+            words = words[1:]
+        if words:
+            words[-1] = cls._singular(words[-1], alone=len(words) == 1)
+        return " ".join(words).casefold()
+
+    def _core(self, canonical):
+        """Canonical form without a trailing generic head word ("bert model" -> "bert")."""
+        words = canonical.split()
+        if len(words) > 1 and words[-1] in self.GENERIC_HEADS:
+            words = words[:-1]
+        return " ".join(words)
+
+    @staticmethod
+    def _compatible(a, b):
+        """
+        Whether two core forms may name the same entity: same numbers, and the same words up to
+        order, spacing or a small spelling difference in words longer than three characters.
+        """
+        if a == b:
+            return True
+        if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+            return False
+        if a.replace(" ", "") == b.replace(" ", ""):
+            return True
+        left, right = a.split(), b.split()
+        if len(left) != len(right):
+            return False
+        if sorted(left) == sorted(right):
+            return True
+        for x, y in zip(left, right):
+            if x == y:
+                continue
+            if min(len(x), len(y)) <= 3 or x + "s" == y or y + "s" == x or x + "es" == y or y + "es" == x:
+                return False
+        return True
+
+    def _blocking_keys(self, canonical):
+        words = canonical.split()
+        keys = [("tokens", " ".join(sorted(words))), ("head", self._core(canonical))]
+        compact = canonical.replace(" ", "")
+        # Spacing and hyphenation variants ("pre-training", "pretraining") share this key
+        keys.append(("compact", compact))
+        if len(compact) >= self.prefix_length:
+            keys.append(("prefix", compact[:self.prefix_length]))
+        return keys
+
+    @staticmethod
+    def _trigram_matrix(texts):
+        """L2-normalized sparse matrix of the character trigram counts of every text."""
+        vocabulary = {}
+        rows, cols = [], []
+        for row, text in enumerate(texts):
+            padded = f"  {text} "
+            for i in range(len(padded) - 2):
+                rows.append(row)
+                cols.append(vocabulary.setdefault(padded[i:i + 3], len(vocabulary)))
+        matrix = sp.csr_array(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(texts), max(1, len(vocabulary)))
+        )
+        matrix.sum_duplicates()
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1))
+        norms[norms == 0] = 1.0
+        return sp.csr_array(sp.diags_array(1 / norms) @ matrix)
+
+    def _candidate_pairs(self, forms):
+        """
+        Pairs of canonical form ids sharing a blocking key whose trigram similarity (without generic
+        head words) is high enough and whose words are compatible.
+        """
+        blocks = defaultdict(list)
+        for form_id, form in enumerate(forms):
+            for key in self._blocking_keys(form):
+                blocks[key].append(form_id)
+
+        cores = [self._core(form) for form in forms]
+        trigrams = self._trigram_matrix(cores)
+        threshold = self.min_name_similarity if self.embed_model is not None else self.name_threshold
+        pairs = set()
+        for (kind, _), members in blocks.items():
+            if len(members) < 2 or len(members) > self.max_block_size:
+                continue
+            members = np.asarray(members)
+            if kind == "compact":
+                # Only spacing differs, which the trigrams overrate
+                left, right = np.triu_indices(len(members), k=1)
+            else:
+                block = trigrams[members]
+                similarity = (block @ block.T).toarray()
+                left, right = np.nonzero(np.triu(similarity, k=1) >= threshold)
+            pairs.update(
+                (i, j)
+                for i, j in zip(members[left].tolist(), members[right].tolist())
+                if self._compatible(cores[i], cores[j])
+            )
+        return pairs
+
+    def _confirm(self, forms, pairs):
+        """The candidate pairs whose embeddings are similar enough (all of them without an embedding model)."""
+        if self.embed_model is None or not pairs:
+            return list(pairs)
+        form_ids = sorted({form_id for pair in pairs for form_id in pair})
+        position = {form_id: i for i, form_id in enumerate(form_ids)}
+        embeddings = np.asarray(
+            self.embed_model.get_text_embedding_batch([forms[form_id] for form_id in form_ids]), dtype=np.float32
+        )
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        pairs = list(pairs)
+        left = np.array([position[i] for i, _ in pairs])
+        right = np.array([position[j] for _, j in pairs])
+        similarity = np.einsum("ij,ij->i", embeddings[left], embeddings[right])
+        return [pair for pair, score in zip(pairs, similarity) if score >= self.embedding_threshold]
+
+    def resolve(self, names, degrees=None):
+        """
+        Returns ({canonical entity name: [alias names]}, [names to drop]). The name kept for a group
+        is the one with the most neighbours (degrees, aligned with names), then the shortest.
+        """
+        degrees = np.zeros(len(names)) if degrees is None else degrees
+        dropped = [name for name in names if name in self.DUMMY_NAMES]
+
+        # Names -> canonical forms; names sharing a form are merged outright
+        form_ids = {}
+        name_forms = []
+        for name in names:
+            if name in self.DUMMY_NAMES:
+                name_forms.append(None)
+                continue
+            form = self.canonicalize(name)
+            name_forms.append(form_ids.setdefault(form, len(form_ids)))
+        forms = list(form_ids)
+
+        # Union-find over canonical forms, for the confirmed fuzzy matches
+        parent = list(range(len(forms)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for i, j in self._confirm(forms, self._candidate_pairs(forms)):
+            parent[find(i)] = find(j)
+
+        clusters = defaultdict(list)
+        for name_id, form_id in enumerate(name_forms):
+            if form_id is not None:
+                clusters[find(form_id)].append(name_id)
+        groups = {}
+        for members in clusters.values():
+            if len(members) < 2:
+                continue
+            # Ties go to the first name in sorted order, which prefers upper case ("BERT" over "Bert")
+            members.sort(key=lambda name_id: names[name_id])
+            keep = max(members, key=lambda name_id: (degrees[name_id], -len(names[name_id])))
+            groups[names[keep]] = [names[name_id] for name_id in members if name_id != keep]
+        return groups, dropped
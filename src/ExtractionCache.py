@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+"""
+On-disk, content-addressed cache for GraphRAGExtractor.
+Entries are keyed by a hash of everything that influences an extraction (chunk text, prompt
+template, model name and max_paths_per_chunk), so re-ingesting unchanged abstracts never has to
+call the LLM again. Backed by a single SQLite file, with least-recently-used eviction once the
+number of entries exceeds max_entries.
+"""
+class ExtractionCache():
+
+    def __init__(self, path="cache/extractions.sqlite", max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                raw_response TEXT NOT NULL,
+                entities TEXT NOT NULL,
+                relationships TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS extractions_last_access ON extractions (last_access)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    @staticmethod
+    def make_key(text, prompt_template, model_name, max_paths_per_chunk):
+        """Hash every input that can change the extraction output into a single cache key."""
+        digest = hashlib.sha256()
+        for part in (text, prompt_template, str(model_name), str(max_paths_per_chunk)):
+            digest.update(part.encode("utf-8"))
+            # Separator so that ("ab", "c") and ("a", "bc") hash differently
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns (raw_response, entities, relationships) for a cached extraction, or None on a miss.
+        Entities and relationships are returned as lists of tuples, exactly as parse_fn produced them.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw_response, entities, relationships FROM extractions WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE extractions SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+
+        raw_response, entities, relationships = row
+        entities = [tuple(e) for e in json.loads(entities)]
+        relationships = [tuple(r) for r in json.loads(relationships)]
+        return raw_response, entities, relationships
+
+    def put(self, key, raw_response, entities, relationships):
+        """Store an extraction result, evicting the least recently used entries past max_entries."""
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    raw_response,
+                    json.dumps([list(e) for e in entities]),
+                    json.dumps([list(r) for r in relationships]),
+                    time.time(),
+                ),
+            )
+            if not exists:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._conn.execute(
+                    """
+                    DELETE FROM extractions WHERE key IN (
+                        SELECT key FROM extractions ORDER BY last_access ASC LIMIT ?
+                    )
+                    """,
+                    (self._size - self.max_entries,),
+                )
+                self._size = self.max_entries
+            self._conn.commit()
+
+    def __len__(self):
+        return self._size
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        """Print the hit/miss counts collected since the last reset."""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        print(
+            f"Extraction cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1f}% hit rate), {self._size} entries stored in {self.path}"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
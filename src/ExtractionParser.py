@@ -0,0 +1,86 @@
+import re
+
+"""
+Single-pass parser for the extraction format of GraphRAG.KG_TRIPLET_EXTRACT_TMPL:
+    ("entity"$$$$<name>$$$$<type>$$$$<description>)
+    ("relationship"$$$$<source>$$$$<target>$$$$<relation>$$$$<description>)
+A precompiled pattern finds the start of every record. A record ends at the first closing parenthesis
+followed by a record delimiter (end of line or ##), the completion delimiter (<|COMPLETE|>), the next
+record or the end of the response, and its fields are split on the $$$$ delimiter, so descriptions may
+contain parentheses and prose after the records is ignored even when it has parentheses of its own.
+Records with missing fields or empty names, and text around the records, are skipped instead of failing
+the chunk.
+The parser can be fed a streamed response delta by delta: a record is complete once the next one
+starts, and done becomes True once max_relationships relationships have been parsed, so the caller
+can stop generation early.
+"""
+class ExtractionParser():
+    RECORD_START = re.compile(r'\(\s*"(entity|relationship)"\s*\$\$\$\$')
+    DELIMITER = "$$$$"
+    # A ")" that closes a record: followed by a record delimiter, the completion delimiter or the end of the record's span
+    RECORD_END = re.compile(r'\)[ \t]*(?=\r?\n|##|<\|COMPLETE\|>|$)')
+    # Characters kept from the end of the text when scanning the next delta, for record starts split between deltas
+    OVERLAP = 64
+
+    def __init__(self, max_relationships=None):
+        self.max_relationships = max_relationships
+        self.entities = []
+        self.relationships = []
+        self._text = ""
+        self._scan_from = 0
+        # (kind, offset of its fields) of the record being read
+        self._record = None
+
+    @classmethod
+    def parse(cls, text, max_relationships=None):
+        """Parse a complete response into (entities, relationships)."""
+        parser = cls(max_relationships)
+        parser.feed(text)
+        return parser.close()
+
+    @property
+    def text(self):
+        return self._text
+
+    @property
+    def done(self):
+        return self.max_relationships is not None and len(self.relationships) >= self.max_relationships
+
+    def feed(self, delta):
+        """Add the next piece of the response; returns done."""
+        self._text += delta
+        for match in self.RECORD_START.finditer(self._text, self._scan_from):
+            if self._record is not None:
+                self._add_record(*self._record, match.start())
+            self._record = (match.group(1), match.end())
+            self._scan_from = match.end()
+            if self.done:
+                return True
+        self._scan_from = max(self._scan_from, len(self._text) - self.OVERLAP)
+        return self.done
+
+    def close(self):
+        """Parse the last record and return (entities, relationships)."""
+        if self._record is not None and not self.done:
+            self._add_record(*self._record, len(self._text))
+        self._record = None
+        relationships = self.relationships
+        if self.max_relationships is not None:
+            relationships = relationships[:self.max_relationships]
+        return self.entities, relationships
+
+    def _add_record(self, kind, start, end):
+        # Without a delimiter after any ")", the first one is taken as the end of the record
+        match = self.RECORD_END.search(self._text, start, end)
+        end = match.start() if match else self._text.find(")", start, end)
+        if end == -1:
+            return
+        fields = [field.strip() for field in self._text[start:end].split(self.DELIMITER)]
+        if kind == "entity":
+            if len(fields) < 3 or not fields[0]:
+                return
+            self.entities.append((fields[0], fields[1], self.DELIMITER.join(fields[2:])))
+        else:
+            if len(fields) < 4 or not fields[0] or not fields[1] or not fields[2]:
+                return
+            self.relationships.append((fields[0], fields[1], fields[2], self.DELIMITER.join(fields[3:])))
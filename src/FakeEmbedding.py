@@ -0,0 +1,33 @@
+import re
+import zlib
+import numpy as np
+from typing import List
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+"""
+Deterministic stand-in for the HuggingFace embedding model, used by the benchmarks.
+Texts are embedded as normalized hashed bags of words, so texts sharing terms are similar and no
+model has to be downloaded or run.
+"""
+class FakeEmbedding(BaseEmbedding):
+    dim: int = 64
+
+    @classmethod
+    def class_name(cls):
+        return "FakeEmbedding"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
@@ -0,0 +1,104 @@
+import re
+import time
+import zlib
+import asyncio
+from typing import Any, Sequence
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata, ChatMessage, ChatResponse
+from llama_index.core.llms.callbacks import llm_completion_callback, llm_chat_callback
+from llama_index.core.base.llms.generic_utils import (
+    completion_response_to_chat_response,
+    astream_completion_response_to_chat_response,
+)
+
+"""
+Deterministic stand-in for the Ollama LLM, used by the benchmarks (and handy for offline runs).
+Extraction prompts are answered with well-formed ("entity"$$$$...) and ("relationship"$$$$...) lines
+built from the capitalized terms of the prompt's text, so the same chunk always yields the same graph.
+Batched extraction prompts ([CHUNK <i>] tagged texts) are answered chunk by chunk under the same tags.
+Any other prompt (community summaries, answers) gets a short answer naming the terms it mentions.
+Every call waits latency seconds, asynchronously in the async methods, to mimic a model server.
+"""
+class FakeLLM(CustomLLM):
+    latency: float = 0.0
+    relations: Sequence[str] = ("uses", "improves", "evaluates", "extends", "compares_with")
+    entity_types: Sequence[str] = ("METHOD", "MODEL", "DATASET", "TASK", "METRIC")
+
+    @classmethod
+    def class_name(cls):
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-llm", is_chat_model=False)
+
+    @staticmethod
+    def _choose(options, *parts):
+        return options[zlib.crc32("\x00".join(parts).encode("utf-8")) % len(options)]
+
+    def respond(self, prompt):
+        """The response to a prompt, without any latency."""
+        match = re.search(r"texts?:(.*?)#{6,}\s*output:", prompt, re.DOTALL)
+        if match is None:
+            terms = list(dict.fromkeys(re.findall(r"\b[A-Z][A-Za-z0-9-]{2,}\b", prompt)))[:8]
+            return f"These results concern {', '.join(terms) or 'the graph'}, and how they relate to each other."
+
+        limit = re.search(r"extract up to (\d+)", prompt)
+        limit = int(limit.group(1)) if limit else 10
+        parts = re.split(r"(\[CHUNK \d+\])", match.group(1))
+        if len(parts) == 1:
+            return self._extract(parts[0], limit)
+        return "\n".join(f"{tag}\n{self._extract(text, limit)}" for tag, text in zip(parts[1::2], parts[2::2]))
+
+    def _extract(self, text, limit):
+        terms = list(dict.fromkeys(re.findall(r"\b[A-Z][A-Za-z0-9-]{2,}\b", text)))[:limit]
+        lines = [
+            f'("entity"$$$${term}$$$${self._choose(self.entity_types, term)}$$$${term} as described in the text.)'
+            for term in terms
+        ]
+        for source, target in zip(terms, terms[1:]):
+            relation = self._choose(self.relations, source, target)
+            lines.append(f'("relationship"$$$${source}$$$${target}$$$${relation}$$$${source} {relation} {target}.)')
+        return "\n".join(lines)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        return CompletionResponse(text=self.respond(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        if self.latency:
+            time.sleep(self.latency)
+        yield from self._deltas(prompt)
+
+    def _deltas(self, prompt):
+        text = ""
+        for token in re.findall(r"\S+\s*", self.respond(prompt)):
+            text += token
+            yield CompletionResponse(text=text, delta=token)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return CompletionResponse(text=self.respond(prompt))
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        prompt = self.messages_to_prompt(messages)
+        return completion_response_to_chat_response(await self.acomplete(prompt, formatted=True))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen():
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            for response in self._deltas(prompt):
+                yield response
+        return gen()
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        prompt = self.messages_to_prompt(messages)
+        return astream_completion_response_to_chat_response(await self.astream_complete(prompt, formatted=True))
@@ -1,20 +1,32 @@
 
-import re
+import os
+import asyncio
 import time
-import pandas as pd
+import polars as pl
 from llama_index.core import Document, PropertyGraphIndex
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.llms.ollama import Ollama
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from GraphRAGExtractor import GraphRAGExtractor
+from ExtractionParser import ExtractionParser
 from GraphRAGStore import GraphRAGStore
+from InMemoryGraphStore import InMemoryGraphStore
 from GraphRAGQueryEngine import GraphRAGQueryEngine
+from ExtractionCache import ExtractionCache
+from CachedEmbedding import CachedEmbedding
+from LocalVectorIndex import LocalVectorIndex
+from QueryCache import QueryCache
+from IngestionCheckpoint import IngestionCheckpoint
+from Instrumentation import instrumentation
+from LLMScheduler import LLMScheduler
+from LLMPool import LLMPool
+from EntityResolver import EntityResolver
 from pyvis.network import Network
 
 """
 This class initializes sets up the subcomponents required for the GraphRAG system, and controls
 their interactions: 
-- GraphRAGStore
+- GraphRAGStore (Neo4j) or InMemoryGraphStore
 - GraphRAGExtractor
 - GraphRAGQueryEngine
 """
@@ -49,71 +61,338 @@ class GraphRAG():
         ######################
         output:"""
 
+    # Same extraction over several texts at once, each tagged [CHUNK <i>], with the output grouped by tag
+    KG_TRIPLET_BATCH_EXTRACT_TMPL = """
+        -Goal-
+        You are given several text documents, each starting with a tag like [CHUNK 0]. For each text separately, identify all entities and their entity types from the text and all relationships among the identified entities.
+        For each text, extract up to {max_knowledge_triplets} entity-relation triplets.
+
+        -Steps-
+        For each text, in order:
+        1. Write the tag of the text on its own line, exactly as given (e.g. [CHUNK 0]).
+
+        2. Identify all entities of the text. For each identified entity, extract the following information:
+        - entity_name: Name of the entity, capitalized
+        - entity_type: Type of the entity
+        - entity_description: Comprehensive description of the entity's attributes and activities
+        Format each entity as ("entity"$$$$<entity_name>$$$$<entity_type>$$$$<entity_description>)
+
+        3. From the entities identified in step 2, identify all pairs of (source_entity, target_entity) that are *clearly related* to each other.
+        For each pair of related entities, extract the following information:
+        - source_entity: name of the source entity, as identified in step 2
+        - target_entity: name of the target entity, as identified in step 2
+        - relation: relationship between source_entity and target_entity
+        - relationship_description: explanation as to why you think the source entity and the target entity are related to each other
+
+        Format each relationship as ("relationship"$$$$<source_entity>$$$$<target_entity>$$$$<relation>$$$$<relationship_description>)
+
+        Only use entities from the same text in a relationship. When every text is done, output.
+
+        -Real Data-
+        ######################
+        texts:
+        {texts}
+        ######################
+        output:"""
+
         
-    def __init__(self, json_path, nrows, database, llm, embed_model):
+    def __init__(
+            self,
+            json_path,
+            nrows,
+            database,
+            llm,
+            embed_model,
+            cache_path="cache/extractions.sqlite",
+            warm_start=False,
+            query_timeout=None,
+            query_cache_threshold=0.95,
+            community_level=None,
+            offset=0,
+            categories=None,
+            batch_size=100,
+            checkpoint_path="cache/ingestion_checkpoint.json",
+            resume=True,
+            backend="neo4j",
+            snapshot_path="cache/graph_snapshot.npz",
+            embedding_cache_dir="cache/embeddings",
+            vector_index_path=None,
+            metrics_path=None,
+            stream_extraction=True,
+            extraction_batch_tokens=0,
+            llm_max_concurrency=8,
+            llm_timeout=600.0,
+            llm_retries=2,
+            llm_endpoints=None,
+            resolve_entities=True,
+            max_query_communities=10,
+            community_threshold=0.0,
+            global_search=True,
+        ):
         print(f"Initializing GraphRAG...")
+        # Passing metrics_path enables the per-stage instrumentation, written there as JSON (and .prom)
+        self.metrics_path = metrics_path
+        if metrics_path:
+            instrumentation.enable()
         self.json_path = json_path
         self.nrows = nrows
+        # Rows to skip, and optional arXiv categories (e.g. ["cs.CL"]) to keep, when loading the corpus
+        self.offset = offset
+        self.categories = categories
+        # Papers extracted and inserted per batch, with a checkpoint written after each one
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
         self.database = database
-        self.llm = Ollama(model=llm,  request_timeout=20000)
-        self.embed_model = HuggingFaceEmbedding(embed_model)
+        # Community hierarchy level to build and query; None builds every level bottom-up
+        self.community_level = community_level
+        # Passing cache_path=None disables the extraction cache
+        self.extraction_cache = ExtractionCache(cache_path) if cache_path else None
+        # Model names are loaded through Ollama / HuggingFace; LLM and embedding instances are used as given
+        if llm_endpoints:
+            # Several Ollama servers of the same model, load-balanced with health checks and failover
+            if not isinstance(llm, str):
+                raise ValueError("llm_endpoints needs a model name as llm")
+            self.llm = LLMPool.from_endpoints(llm, llm_endpoints, request_timeout=20000, timeout=llm_timeout)
+            self.llm.start_health_checks()
+            print(f"LLM pool initialized with {len(llm_endpoints)} endpoints.")
+        else:
+            self.llm = Ollama(model=llm,  request_timeout=20000) if isinstance(llm, str) else llm
+        # llm_max_concurrency is per endpoint, so that throughput scales with the number of backends
+        llm_max_concurrency *= len(llm_endpoints or [None])
+        # Every LLM call goes through one scheduler: adaptive concurrency, timeouts, retries, and queries first
+        # With a pool, llm_timeout applies to each backend, and a call may fail over to every one of them
+        self.scheduler = LLMScheduler(
+            max_concurrency=llm_max_concurrency,
+            timeout=llm_timeout * len(llm_endpoints or [None]),
+            max_retries=llm_retries,
+        )
+        summary_llm = self.scheduler.wrap(self.llm, LLMScheduler.SUMMARY)
+        self.embed_model = HuggingFaceEmbedding(embed_model) if isinstance(embed_model, str) else embed_model
+        # Passing embedding_cache_dir=None disables the embedding cache
+        if embedding_cache_dir:
+            self.embed_model = CachedEmbedding(self.embed_model, cache_dir=embedding_cache_dir)
         
         
-        self.graph_store = GraphRAGStore(
-            username="neo4j", 
-            password="password", 
-            url="bolt://localhost:7687", 
-            database=self.database,
-            llm=self.llm,
-        )
-        print(f"GraphRAGStore initialized with database: {database}")
+        # "neo4j" keeps the graph in a Neo4j server; "memory" keeps it in-process, snapshotted to snapshot_path
+        if backend == "memory":
+            self.graph_store = InMemoryGraphStore(
+                llm=summary_llm,
+                snapshot_path=snapshot_path,
+                summary_workers=llm_max_concurrency,
+                summary_retries=0,
+                embed_model=self.embed_model,
+            )
+            print(f"InMemoryGraphStore initialized with snapshot: {snapshot_path}")
+        elif backend == "neo4j":
+            self.graph_store = GraphRAGStore(
+                username="neo4j", 
+                password="password", 
+                url="bolt://localhost:7687", 
+                database=self.database,
+                llm=summary_llm,
+                summary_workers=llm_max_concurrency,
+                summary_retries=0,
+                embed_model=self.embed_model,
+            )
+            print(f"GraphRAGStore initialized with database: {database}")
+        else:
+            raise ValueError(f"Unknown graph store backend: {backend}")
+
+        # Merges differently written names of the same entity before communities are built
+        self.entity_resolver = EntityResolver(embed_model=self.embed_model) if resolve_entities else None
 
+        # With stream_extraction, responses are parsed as they stream in and generation stops at max_paths_per_chunk relationships
         self.kg_extractor = GraphRAGExtractor(
-            llm=self.llm,
+            llm=self.scheduler.wrap(self.llm, LLMScheduler.EXTRACTION),
             extract_prompt=self.KG_TRIPLET_EXTRACT_TMPL,
             max_paths_per_chunk=20,
-            num_workers=4,
+            # The scheduler decides how many of these calls actually run at once
+            num_workers=llm_max_concurrency,
             parse_fn=self.parse_fn,
+            cache=self.extraction_cache,
+            stream_parser=ExtractionParser if stream_extraction else None,
+            # extraction_batch_tokens > 0 packs several short chunks into each extraction prompt, up to that many tokens
+            batch_extract_prompt=self.KG_TRIPLET_BATCH_EXTRACT_TMPL,
+            max_batch_tokens=extraction_batch_tokens,
         )
         print(f"GraphRAGExtractor initialized.")
-        nodes = self.create_nodes_from_json()
-        self.index = PropertyGraphIndex(
-            nodes=nodes,
-            kg_extractors=[self.kg_extractor],
+
+        warm_started = warm_start and self.graph_store.has_graph() and self.graph_store.load_communities()
+        if warm_started:
+            # Reattach to the graph and communities from a previous run, skipping all LLM work
+            print(f"Warm start: loaded {len(self.graph_store.community_summary)} communities from {database}.")
+            # Communities saved before their summaries were embedded are embedded (and saved) once
+            if self.graph_store.embed_communities():
+                self.graph_store.save_communities()
+            self.index = PropertyGraphIndex.from_existing(
+                property_graph_store=self.graph_store,
+                kg_extractors=[self.kg_extractor],
+                llm=self.llm,
+                embed_model=self.embed_model,
+            )
+            if not os.path.exists('community_graph.html'):
+                self.save_community_graph()
+        else:
+            if warm_start:
+                print(f"Warm start: no existing graph found in {database}, building from scratch.")
+            self.build_index()
+
+        # Optional local vector index over the entity embeddings, used instead of the store's vector search
+        self.vector_index = self.load_vector_index(vector_index_path, rebuild=not warm_started) if vector_index_path else None
+
+        self.query_engine = GraphRAGQueryEngine(
+            graph_store=self.index.property_graph_store,
+            llm=self.scheduler.wrap(self.llm, LLMScheduler.QUERY),
+            num_workers=llm_max_concurrency,
+            index=self.index,
+            embed_model=self.embed_model,
+            similarity_top_k=10,
+            timeout=query_timeout,
+            level=self.community_level,
+            query_cache=QueryCache(self.embed_model, similarity_threshold=query_cache_threshold),
+            vector_index=self.vector_index,
+            # Only the max_query_communities communities most similar to the query are answered
+            max_communities=max_query_communities,
+            community_threshold=community_threshold,
+            global_search=global_search,
+        )
+        print(f"GraphRAG initialized, and ready for queries.")
+
+    def build_index(self):
+        """
+        Extracts the graph from the dataset batch by batch, then builds and summarizes its communities.
+        Each batch goes through the extractor and into the index with an incremental insert, and a
+        checkpoint is written after it, so an interrupted run resumes where it stopped and only one
+        batch of nodes is held in memory at a time.
+        """
+        self.index = PropertyGraphIndex.from_existing(
             property_graph_store=self.graph_store,
+            kg_extractors=[self.kg_extractor],
             llm=self.llm,
             show_progress=True,
             embed_model=self.embed_model,
         )
+        # A checkpoint is meaningless once the graph it describes is gone (cleared database, no snapshot)
+        checkpoint = IngestionCheckpoint(
+            self.checkpoint_path, self.json_path, resume=self.resume and self.graph_store.has_graph()
+        )
+
+        # Papers ingested by a previous run; built once, not per batch
+        skipped_ids = pl.Series(list(checkpoint.processed_ids), dtype=pl.Utf8)
+        if self.extraction_cache is not None:
+            self.extraction_cache.reset_stats()
+        for batch_number, papers in enumerate(self.iter_corpus_batches(), start=1):
+            if len(skipped_ids):
+                papers = papers.filter(~pl.col("id").is_in(skipped_ids))
+            if papers.is_empty():
+                continue
+            print(f"Ingesting batch {batch_number} ({len(papers)} papers)...")
+            with instrumentation.span("ingest.chunking"):
+                nodes = self.create_nodes(papers)
+            with instrumentation.span("ingest.insert"):
+                self.index.insert_nodes(nodes)
+            # The chunks now live in the graph store; drop the docstore's in-memory copy to keep memory bounded
+            for node in nodes:
+                self.index.docstore.delete_document(node.node_id, raise_error=False)
+            with instrumentation.span("ingest.checkpoint"):
+                # Buffered upserts must be in Neo4j before the batch is marked as done
+                self.graph_store.flush()
+                checkpoint.record_batch(batch_number, papers["id"].to_list())
+            instrumentation.count("papers_ingested", len(papers))
+        print(f"Ingestion complete: {len(checkpoint.processed_ids)} papers in the graph.")
+        self.graph_store.report_upserts()
+        if isinstance(self.embed_model, CachedEmbedding):
+            self.embed_model.report()
+        if self.extraction_cache is not None:
+            self.extraction_cache.report()
+
+        if self.entity_resolver is not None:
+            try:
+                print(f"Resolving entities...")
+                with instrumentation.span("entity_resolution"):
+                    self.graph_store.resolve_entities(self.entity_resolver)
+            except Exception as e:
+                print(f"Error resolving entities:")
+                print(e)
+
         try:
             print(f"Building communities...")
-            self.index.property_graph_store.build_communities()
+            with instrumentation.span("communities"):
+                self.index.property_graph_store.build_communities(level=self.community_level)
             print(f"Communities built.")
             self.save_community_graph()
             print(f"Community graph saved.")
         except Exception as e:
             print(f"Error building communities:")
             print(e)
-        
-        self.query_engine = GraphRAGQueryEngine(
-            graph_store=self.index.property_graph_store,
-            llm=self.llm,
-            index=self.index,
-            similarity_top_k=10,
-        )
-        print(f"GraphRAG initialized, and ready for queries.")
+        self.scheduler.report()
+        if isinstance(self.llm, LLMPool):
+            self.llm.report()
+        self.write_metrics()
 
+    def write_metrics(self):
+        """Write the collected metrics to metrics_path as JSON, and next to it in the Prometheus text format."""
+        if not self.metrics_path:
+            return
+        instrumentation.to_json(self.metrics_path)
+        with open(os.path.splitext(self.metrics_path)[0] + ".prom", 'w', encoding='utf-8') as f:
+            f.write(instrumentation.to_prometheus())
        
+    def load_vector_index(self, path, rebuild=False):
+        """Load the local vector index saved at path, or (re)build it from the graph store's entity embeddings."""
+        if not rebuild and LocalVectorIndex.exists(path):
+            vector_index = LocalVectorIndex.load(path)
+            print(f"Loaded local vector index with {len(vector_index)} entities from {path}.")
+            return vector_index
+        vector_index = LocalVectorIndex.from_pages(self.graph_store.iter_entity_embeddings())
+        vector_index.save(path)
+        print(f"Built local vector index with {len(vector_index)} entities in {path}.")
+        return vector_index
+
+    def scan_corpus(self):
+        """
+        Lazily scan the corpus, reading only the columns needed to build documents. Arrow/IPC files
+        are memory-mapped, parquet files are read column by column, and line-delimited JSON is still
+        supported. Offset/nrows and the category filter are pushed down into the scan.
+        """
+        if self.json_path.endswith((".arrow", ".ipc", ".feather")):
+            papers = pl.scan_ipc(self.json_path, memory_map=True)
+        elif self.json_path.endswith(".parquet"):
+            papers = pl.scan_parquet(self.json_path)
+        else:
+            papers = pl.scan_ndjson(self.json_path)
+
+        if self.categories:
+            pattern = r"\b(?:" + "|".join(self.categories).replace(".", r"\.") + r")\b"
+            papers = papers.filter(pl.col("categories").str.contains(pattern))
+        return papers.select("id", "title", "abstract").slice(self.offset, self.nrows)
+
+    def iter_corpus_batches(self):
+        """
+        Yields the corpus slice as DataFrames of at most batch_size papers. The slice is read once
+        (only its id, title and abstract columns); slicing the scan per batch would re-read the
+        source from the start for every batch.
+        """
+        papers = self.scan_corpus().collect()
+        yield from papers.iter_slices(n_rows=self.batch_size)
+
     def create_nodes_from_json(self):
-        papers = pd.read_json(self.json_path, lines=True, nrows=self.nrows)
-        print(f"Reading {self.nrows} rows from {self.json_path}")
-        print(f"Found papers:")
-        for i, row in papers.iterrows():
-            print(f"{i+1}. {row['title']}")
-        
+        papers = self.scan_corpus().collect()
+        print(f"Read {len(papers)} papers (offset {self.offset}, limit {self.nrows}) from {self.json_path}")
+        return self.create_nodes(papers)
+
+    def create_nodes(self, papers):
+        """Split a DataFrame of papers (id, title, abstract) into nodes, tagged with their arXiv id."""
         documents = [
-            Document(text=f"{row['title']}: {row['abstract']}",)
-            for i, row in papers.iterrows()
+            Document(
+                text=f"{title}: {abstract}",
+                metadata={"arxiv_id": arxiv_id},
+                # Keep the id out of the prompt and the embedding, so extractions and cache keys are unchanged
+                excluded_llm_metadata_keys=["arxiv_id"],
+                excluded_embed_metadata_keys=["arxiv_id"],
+            )
+            for arxiv_id, title, abstract in papers.iter_rows()
         ]
 
         splitter = SentenceSplitter(
@@ -126,30 +405,8 @@ class GraphRAG():
         return nodes
 
     def parse_fn(self, response_str: str):
-        # Regex that helps us extract the entities and relationships from the LLM output
-        entity_pattern = r'\("entity"\$\$\$\$(.*?)\$\$\$\$(.*?)\$\$\$\$(.*?)\)'
-        relationship_pattern = r'\("relationship"\$\$\$\$(.*?)\$\$\$\$(.*?)\$\$\$\$(.*?)\$\$\$\$(.*?)\)'
-        
-        entities = re.findall(entity_pattern, response_str, re.DOTALL)
-        relationships = re.findall(relationship_pattern, response_str, re.DOTALL)
-        
-        entities = [(e1.strip(), e2.strip(), e3.strip()) for e1, e2, e3 in entities]
-        relationships = [(r1.strip(), r2.strip(), r3.strip(), r4.strip()) 
-                        for r1, r2, r3, r4 in relationships]
-        
-        # Here I add default values if the entities or relationships are empty  
-        # -- This tends to happen when our local LLM hallucinates, and doesn't follow the specified formatting
-        if not entities:
-            print("Using Dummy Entities")
-            entities = [("DummyEntityName", "DummyEntityType", "DummyEntityDescription")]
-        if not relationships:
-            print("Using Dummy Relationships")
-            relationships = [("DummyRelationshipSourceEntity", "DummyRelationshipTargetEntity", "DummyR", "DummyR")]
-        
-        print(f"Found entities: {entities}")
-        print(f"Found relationships: {relationships}")
-        
-        return entities, relationships
+        # Malformed records are skipped; a chunk the LLM answered in the wrong format simply adds nothing to the graph
+        return ExtractionParser.parse(response_str)
     
     # This lets us visualize the community graph
     def save_community_graph(self):
@@ -159,11 +416,46 @@ class GraphRAG():
             filter_menu = True, 
         )
         net.show_buttons() 
-        net.from_nx(self.graph_store._create_nx_graph()) 
+        net.from_nx(self.graph_store.get_compact_graph().to_nx()) 
         net.write_html('community_graph.html')
     
-    def query(self, query_str):
+    def query(self, query_str, streaming=False):
+        """
+        Answer a query. With streaming=True this returns a generator that yields the answer
+        token by token instead of the full response.
+        """
+        if streaming:
+            return self.stream_query(query_str)
+        # Runs the concurrent query path; nest_asyncio lets this work inside Streamlit's event loop too
+        return asyncio.run(self.aquery(query_str))
+
+    def stream_query(self, query_str):
+        print(f"Querying GraphRAG with: {query_str}")
+        start = time.perf_counter()
+        first_token_at = None
+        response = self.query_engine.stream_query(query_str)
+        for token in response.response_gen:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield token
+        if first_token_at is not None:
+            print(f"Time to first token: {first_token_at - start:.2f}s, total: {time.perf_counter() - start:.2f}s")
+        self.print_trace(response.metadata.get("trace"))
+        self.write_metrics()
+
+    async def aquery(self, query_str):
         print(f"Querying GraphRAG with: {query_str}")
-        response = self.query_engine.query(query_str)
+        response = await self.query_engine.aquery(query_str)
         print(f"Response: {response}")
-        return response
\ No newline at end of file
+        self.print_trace((response.metadata or {}).get("trace"))
+        self.write_metrics()
+        return response
+
+    def print_trace(self, trace):
+        """Print the time a query spent in each stage, if it was traced."""
+        if not trace:
+            return
+        stages = {}
+        for span in trace["spans"]:
+            stages[span["name"]] = stages.get(span["name"], 0) + span["duration_ms"]
+        print(f"Query took {trace['total_ms']:.0f}ms: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in stages.items()))
\ No newline at end of file
@@ -1,3 +1,4 @@
+import re
 import asyncio
 import nest_asyncio
 
@@ -22,8 +23,15 @@ from llama_index.core.prompts.default_prompts import (
 from llama_index.core.schema import TransformComponent, BaseNode
 from llama_index.core import Settings
 from llama_index.llms.ollama import Ollama
+from ExtractionCache import ExtractionCache
+from Instrumentation import instrumentation
 
 
+# Rough characters per token, to estimate prompt sizes without a tokenizer
+CHARS_PER_TOKEN = 4
+# Tag line starting the output of a chunk in a batched extraction response, e.g. "[CHUNK 3]"
+CHUNK_TAG = re.compile(r"^[\s#*]*\[?\s*CHUNK[\s_-]*(\d+)\s*\]?[\s:*]*$", re.IGNORECASE | re.MULTILINE)
+
 """
 CITATION: 
 LlamaIndex Cookbook: GraphRAG Implementation with LlamaIndex - V2
@@ -46,6 +54,21 @@ class GraphRAGExtractor(TransformComponent):
             The number of workers to use for parallel processing.
         max_paths_per_chunk (int):
             The maximum number of paths to extract per chunk.
+        cache (ExtractionCache, optional):
+            On-disk cache of previous extractions. Cache hits skip the LLM call entirely.
+        stream_parser (callable, optional):
+            Factory of an incremental parser (see ExtractionParser), called with max_relationships.
+            When set, the LLM output is streamed and parsed as it arrives instead of with parse_fn,
+            and generation is cancelled once max_paths_per_chunk relationships have been parsed.
+        batch_extract_prompt (Union[str, PromptTemplate], optional):
+            Prompt extracting triples from several chunks at once, formatted with {texts} (the chunks,
+            each under a [CHUNK <i>] tag) and {max_knowledge_triplets}. The output of every chunk must
+            follow its tag.
+        max_batch_tokens (int):
+            Estimated prompt tokens per batched call; 0 disables batching. Chunks whose section of a
+            batched response is missing or malformed are extracted again one by one.
+        max_batch_size (int):
+            The maximum number of chunks per batched call.
     """
 
     llm: LLM
@@ -53,6 +76,11 @@ class GraphRAGExtractor(TransformComponent):
     parse_fn: Callable
     num_workers: int
     max_paths_per_chunk: int
+    cache: Optional[ExtractionCache] = None
+    stream_parser: Optional[Callable] = None
+    batch_extract_prompt: Optional[PromptTemplate] = None
+    max_batch_tokens: int = 0
+    max_batch_size: int = 8
 
     def __init__(
         self,
@@ -61,9 +89,16 @@ class GraphRAGExtractor(TransformComponent):
         parse_fn: Callable = default_parse_triplets_fn,
         max_paths_per_chunk: int = 10,
         num_workers: int = 4,
+        cache: Optional[ExtractionCache] = None,
+        stream_parser: Optional[Callable] = None,
+        batch_extract_prompt: Optional[Union[str, PromptTemplate]] = None,
+        max_batch_tokens: int = 0,
+        max_batch_size: int = 8,
     ) -> None:
         if isinstance(extract_prompt, str):
             extract_prompt = PromptTemplate(extract_prompt)
+        if isinstance(batch_extract_prompt, str):
+            batch_extract_prompt = PromptTemplate(batch_extract_prompt)
 
         super().__init__(
             llm=llm or Settings.llm,
@@ -71,6 +106,11 @@ class GraphRAGExtractor(TransformComponent):
             parse_fn=parse_fn,
             num_workers=num_workers,
             max_paths_per_chunk=max_paths_per_chunk,
+            cache=cache,
+            stream_parser=stream_parser,
+            batch_extract_prompt=batch_extract_prompt,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
         )
 
     @classmethod
@@ -90,18 +130,49 @@ class GraphRAGExtractor(TransformComponent):
         assert hasattr(node, "text")
 
         text = node.get_content(metadata_mode="llm")
-        try:
-            llm_response = await self.llm.apredict(
-                self.extract_prompt,
-                text=text,
-                max_knowledge_triplets=self.max_paths_per_chunk,
-            )
-            print(f"llm_response: {llm_response}")
-            entities, entities_relationship = self.parse_fn(llm_response)
-        except ValueError:
-            entities = []
-            entities_relationship = []
+        cache_key, cached = self._cache_lookup(text)
+        if cached is not None:
+            _, entities, entities_relationship = cached
+        else:
+            try:
+                with instrumentation.llm_call("extraction") as call:
+                    call.prompt_chars = len(text) + len(self.extract_prompt.get_template())
+                    if self.stream_parser is not None:
+                        llm_response, entities, entities_relationship = await self._astream_extract(text)
+                    else:
+                        llm_response = await self.llm.apredict(
+                            self.extract_prompt,
+                            text=text,
+                            max_knowledge_triplets=self.max_paths_per_chunk,
+                        )
+                    call.response_chars = len(llm_response)
+                if self.stream_parser is None:
+                    entities, entities_relationship = self.parse_fn(llm_response)
+                if self.cache is not None:
+                    self.cache.put(cache_key, llm_response, entities, entities_relationship)
+            except ValueError:
+                entities = []
+                entities_relationship = []
+        return self._attach(node, entities, entities_relationship)
+
+    def _cache_lookup(self, text: str):
+        """Returns the cache key of a chunk's text and its cached extraction, if any.
+        Batched and per-chunk extractions of a chunk share the entry of the per-chunk prompt."""
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(
+            text,
+            self.extract_prompt.get_template(),
+            self._model_name(),
+            self.max_paths_per_chunk,
+        )
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            instrumentation.count("extraction_cache_hits")
+        return cache_key, cached
 
+    def _attach(self, node: BaseNode, entities, entities_relationship) -> BaseNode:
+        """Add the extracted entities and relations to the node's metadata."""
         existing_nodes = node.metadata.pop(KG_NODES_KEY, [])
         existing_relations = node.metadata.pop(KG_RELATIONS_KEY, [])
         entity_metadata = node.metadata.copy()
@@ -129,17 +200,145 @@ class GraphRAGExtractor(TransformComponent):
         node.metadata[KG_RELATIONS_KEY] = existing_relations
         return node
 
+    def _estimate_tokens(self, text: str) -> int:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+    def _make_batches(self, items):
+        """Group (node, text, cache_key) items into batches that fit max_batch_tokens and max_batch_size."""
+        overhead = self._estimate_tokens(self.batch_extract_prompt.get_template())
+        batches = []
+        batch, tokens = [], overhead
+        for item in items:
+            item_tokens = self._estimate_tokens(item[1]) + 8
+            if batch and (tokens + item_tokens > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, tokens = [], overhead
+            batch.append(item)
+            tokens += item_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _split_batch_response(self, response: str, size: int):
+        """
+        Split a batched response into the output of each chunk, by chunk tag. A section is only kept when
+        its tag follows the previous chunk's and the next tag is the next chunk's (or the response ends
+        after the last chunk): around a missing, repeated or unknown tag, records may belong to another chunk.
+        """
+        sections = {}
+        tags = [(int(tag.group(1)), tag.start(), tag.end()) for tag in CHUNK_TAG.finditer(response)]
+        for i, (chunk_id, _, start) in enumerate(tags):
+            previous_id = tags[i - 1][0] if i > 0 else -1
+            next_id, end = tags[i + 1][:2] if i + 1 < len(tags) else (size, len(response))
+            if previous_id == chunk_id - 1 and next_id == chunk_id + 1:
+                sections[chunk_id] = response[start:end]
+        return sections
+
+    async def _aextract_batch(self, batch, stats) -> List[BaseNode]:
+        """Extract triples from several chunks with one LLM call, falling back to per-chunk calls."""
+        if len(batch) == 1:
+            return [await self._aextract(batch[0][0])]
+
+        texts = "\n".join(f"[CHUNK {i}]\n{text}\n" for i, (_, text, _) in enumerate(batch))
+        sections = {}
+        try:
+            with instrumentation.llm_call("extraction") as call:
+                call.prompt_chars = len(texts) + len(self.batch_extract_prompt.get_template())
+                llm_response = await self.llm.apredict(
+                    self.batch_extract_prompt,
+                    texts=texts,
+                    max_knowledge_triplets=self.max_paths_per_chunk,
+                )
+                call.response_chars = len(llm_response)
+            sections = self._split_batch_response(llm_response, len(batch))
+        except ValueError:
+            pass
+
+        results = []
+        fallback = []
+        for i, (node, _, cache_key) in enumerate(batch):
+            entities, entities_relationship = self.parse_fn(sections[i]) if i in sections else ([], [])
+            if not entities:
+                fallback.append(node)
+                continue
+            entities_relationship = entities_relationship[:self.max_paths_per_chunk]
+            if self.cache is not None:
+                self.cache.put(cache_key, sections[i], entities, entities_relationship)
+            results.append(self._attach(node, entities, entities_relationship))
+
+        instrumentation.count("extraction_batches")
+        instrumentation.count("extraction_batch_fallbacks", len(fallback))
+        stats[0] += 1
+        stats[1] += len(batch)
+        stats[2] += len(fallback)
+        for node in fallback:
+            results.append(await self._aextract(node))
+        return results
+
+    async def _astream_extract(self, text: str):
+        """Stream the extraction of a chunk through stream_parser, stopping generation once enough relationships are parsed."""
+        parser = self.stream_parser(max_relationships=self.max_paths_per_chunk)
+        prompt = self.extract_prompt.format(
+            text=text, max_knowledge_triplets=self.max_paths_per_chunk
+        )
+        stream = await self.llm.astream_complete(prompt, formatted=True)
+        try:
+            async for chunk in stream:
+                if parser.feed(chunk.delta or ""):
+                    instrumentation.count("extraction_early_stops")
+                    break
+        finally:
+            # Closing the stream closes the request, which stops generation on the server
+            await stream.aclose()
+        entities, relationships = parser.close()
+        return parser.text, entities, relationships
+
+    def _model_name(self) -> str:
+        """Name of the model behind self.llm, used as part of the cache key."""
+        return getattr(self.llm, "model", None) or self.llm.metadata.model_name
+
     async def acall(
         self, nodes: List[BaseNode], show_progress: bool = False, **kwargs: Any
     ) -> List[BaseNode]:
         """Extract triples from nodes async."""
-        jobs = []
+        with instrumentation.span("extraction"):
+            if self.batch_extract_prompt is not None and self.max_batch_tokens > 0:
+                results = await self._acall_batched(nodes, show_progress)
+            else:
+                jobs = []
+                for node in nodes:
+                    jobs.append(self._aextract(node))
+                results = await run_jobs(
+                    jobs,
+                    workers=self.num_workers,
+                    show_progress=show_progress,
+                    desc="Extracting paths from text",
+                )
+        instrumentation.count("chunks_extracted", len(nodes))
+        return results
+
+    async def _acall_batched(self, nodes: List[BaseNode], show_progress: bool) -> List[BaseNode]:
+        """Extract triples from nodes with batched prompts, returning the nodes in their original order."""
+        misses = []
         for node in nodes:
-            jobs.append(self._aextract(node))
+            text = node.get_content(metadata_mode="llm")
+            cache_key, cached = self._cache_lookup(text)
+            if cached is not None:
+                _, entities, entities_relationship = cached
+                self._attach(node, entities, entities_relationship)
+            else:
+                misses.append((node, text, cache_key))
 
-        return await run_jobs(
+        # Calls, chunks and fallbacks of the batched calls, for the report below
+        stats = [0, 0, 0]
+        jobs = [self._aextract_batch(batch, stats) for batch in self._make_batches(misses)]
+        await run_jobs(
             jobs,
             workers=self.num_workers,
             show_progress=show_progress,
-            desc="Extracting paths from text",
-        )
\ No newline at end of file
+            desc="Extracting paths from text batches",
+        )
+        calls, chunks, fallbacks = stats
+        if calls:
+            print(f"Batched extraction: {chunks} chunks in {calls} calls, {fallbacks} re-extracted one by one")
+        return nodes
\ No newline at end of file
@@ -1,7 +1,16 @@
+import asyncio
+from typing import Optional
 from llama_index.core.query_engine import CustomQueryEngine
 from llama_index.core.llms import LLM, ChatMessage
 from llama_index.core import PropertyGraphIndex
-from GraphRAGStore import GraphRAGStore
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.graph_stores.types import KG_SOURCE_REL, EntityNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from llama_index.core.base.response.schema import Response, StreamingResponse
+from CommunityStore import CommunityStore, normalize_entity_name
+from QueryCache import QueryCache
+from LocalVectorIndex import LocalVectorIndex
+from Instrumentation import instrumentation, message_chars
 import re
 
 """
@@ -10,73 +19,275 @@ LlamaIndex Cookbook: GraphRAG Implementation with LlamaIndex - V2
 link: https://docs.llamaindex.ai/en/stable/examples/cookbooks/GraphRAG_v2/#graphragqueryengine
 """
 class GraphRAGQueryEngine(CustomQueryEngine):
-    graph_store: GraphRAGStore
+    graph_store: CommunityStore
     index: PropertyGraphIndex
     llm: LLM 
+    # Embeds queries for entity retrieval; defaults to the index's embedding model
+    embed_model: Optional[BaseEmbedding] = None
     similarity_top_k: int = 20
+    # Max number of neighbouring relations pulled in around the retrieved entities
+    rel_map_limit: int = 30
+    # Max number of per-community LLM calls in flight in acustom_query
+    num_workers: int = 4
+    # Deadline in seconds for the per-community answers in acustom_query; late communities are dropped
+    timeout: Optional[float] = None
+    # Semantic cache for final and per-community answers; None disables caching
+    query_cache: Optional[QueryCache] = None
+    # Community hierarchy level to answer from (0 is the coarsest); None uses every level
+    level: Optional[int] = None
+    # Local index over the entity embeddings; None uses the graph store's vector search
+    vector_index: Optional[LocalVectorIndex] = None
+    # Max number of communities answered per query, the most similar to the query first; None answers all
+    max_communities: Optional[int] = 10
+    # Min cosine similarity between the query and a community's summary for the community to be answered
+    community_threshold: Optional[float] = 0.0
+    # When retrieval finds no entity communities, rank every community instead of answering from none
+    global_search: bool = True
 
-    def custom_query(self, query_str: str) -> str:
-        """Process all community summaries to generate answers to a specific query."""
+    def custom_query(self, query_str: str) -> Response:
+        """
+        Process all community summaries to generate answers to a specific query.
+        When instrumentation is enabled, the query's trace is returned in the response metadata.
+        """
+        with instrumentation.trace(query=query_str) as trace:
+            answer = self._answer(query_str)
+        return Response(response=answer, metadata={"trace": trace})
 
-        entities = self.get_entities(query_str, self.similarity_top_k)
+    def _answer(self, query_str):
+        query_embedding = self._embed_for_cache(query_str)
+        cached_answer = self._cache_lookup(query_embedding)
+        if cached_answer is not None:
+            return cached_answer
 
-        community_ids = self.retrieve_entity_communities(
-            self.graph_store.entity_info, entities
-        )
+        community_ids = self.select_communities(query_str, query_embedding)
         community_summaries = self.graph_store.get_community_summaries()
-        community_answers = [
-            self.generate_answer_from_summary(community_summary, query_str)
-            for id, community_summary in community_summaries.items()
-            if id in community_ids
-        ]
+        community_answers = []
+        with instrumentation.span("query.map"):
+            for id in community_ids:
+                community_summary = community_summaries.get(id)
+                if community_summary is None:
+                    continue
+                community_answer = self._cache_lookup(query_embedding, namespace=id)
+                if community_answer is None:
+                    community_answer = self.generate_answer_from_summary(community_summary, query_str)
+                    self._cache_store(query_embedding, community_answer, namespace=id)
+                community_answers.append(community_answer)
 
-        final_answer = self.aggregate_answers(community_answers)
+        with instrumentation.span("query.reduce"):
+            final_answer = self.aggregate_answers(community_answers)
+        self._cache_store(query_embedding, final_answer)
         return final_answer
 
-    def get_entities(self, query_str, similarity_top_k):
-        nodes_retrieved = self.index.as_retriever(
-            similarity_top_k=similarity_top_k
-        ).retrieve(query_str)
+    async def acustom_query(self, query_str: str) -> Response:
+        """Async version of custom_query, with the per-community answers generated concurrently."""
+        with instrumentation.trace(query=query_str) as trace:
+            answer = await self._aanswer(query_str)
+        return Response(response=answer, metadata={"trace": trace})
+
+    async def _aanswer(self, query_str):
+        query_embedding = self._embed_for_cache(query_str)
+        cached_answer = self._cache_lookup(query_embedding)
+        if cached_answer is not None:
+            return cached_answer
+
+        with instrumentation.span("query.map"):
+            community_answers = await self.agenerate_community_answers(query_str, query_embedding)
+        with instrumentation.span("query.reduce"):
+            final_answer = await self.aaggregate_answers(community_answers)
+        self._cache_store(query_embedding, final_answer)
+        return final_answer
+
+    def stream_query(self, query_str: str) -> StreamingResponse:
+        """
+        Streaming version of custom_query. The response generator runs the concurrent map phase,
+        then yields the aggregated answer token by token as the LLM produces it. When
+        instrumentation is enabled, the query's trace is in the response metadata once the
+        generator has started, and complete once it is exhausted.
+        """
+        metadata = {"trace": None}
+
+        def response_gen():
+            with instrumentation.trace(query=query_str) as trace:
+                metadata["trace"] = trace
+                yield from self._stream_answer(query_str)
+
+        return StreamingResponse(response_gen=response_gen(), metadata=metadata)
+
+    def _stream_answer(self, query_str):
+        query_embedding = self._embed_for_cache(query_str)
+        cached_answer = self._cache_lookup(query_embedding)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        with instrumentation.span("query.map"):
+            community_answers = asyncio.run(
+                self.agenerate_community_answers(query_str, query_embedding)
+            )
+        tokens = []
+        with instrumentation.span("query.reduce"):
+            for token in self.stream_aggregate_answers(community_answers):
+                tokens.append(token)
+                yield token
+        self._cache_store(query_embedding, re.sub(r"^assistant:\s*", "", "".join(tokens)).strip())
+
+    async def agenerate_community_answers(self, query_str, query_embedding=None):
+        """
+        Generate the per-community answers for a query concurrently, with at most num_workers calls
+        in flight. If a timeout is set, communities that have not answered by the deadline (or that
+        failed) are dropped and only the remaining answers are returned. Answers cached for a
+        similar query are reused without calling the LLM.
+        """
+        community_ids = self.select_communities(query_str, query_embedding)
+        community_summaries = self.graph_store.get_community_summaries()
+        semaphore = asyncio.Semaphore(self.num_workers)
+
+        async def answer(id, community_summary):
+            community_answer = self._cache_lookup(query_embedding, namespace=id)
+            if community_answer is not None:
+                return community_answer
+            async with semaphore:
+                community_answer = await self.agenerate_answer_from_summary(community_summary, query_str)
+            self._cache_store(query_embedding, community_answer, namespace=id)
+            return community_answer
+
+        tasks = [
+            asyncio.ensure_future(answer(id, community_summaries[id]))
+            for id in community_ids
+            if id in community_summaries
+        ]
+        pending = set()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                # Let the cancelled calls unwind, so they give back their LLM scheduler slots before the reduce call
+                await asyncio.gather(*pending, return_exceptions=True)
+                print(f"Dropped {len(pending)} communities that missed the {self.timeout}s deadline")
+
+        community_answers = []
+        for task in tasks:
+            if task in pending:
+                continue
+            if task.exception() is not None:
+                print(f"Dropped a community answer that failed: {task.exception()}")
+                continue
+            community_answers.append(task.result())
+        return community_answers
+
+    def _embed_for_cache(self, query_str):
+        """Embeds the query for the semantic cache, or returns None when caching is disabled."""
+        if self.query_cache is None:
+            return None
+        self.query_cache.sync(self.graph_store.community_version)
+        with instrumentation.span("query.cache_embed"):
+            return self.query_cache.embed(query_str)
+
+    def _cache_lookup(self, query_embedding, namespace=None):
+        if query_embedding is None:
+            return None
+        value = self.query_cache.lookup(query_embedding, namespace)
+        instrumentation.count("query_cache_lookups", hit=value is not None, final=namespace is None)
+        return value
+
+    def _cache_store(self, query_embedding, value, namespace=None):
+        if query_embedding is not None:
+            self.query_cache.store(query_embedding, value, namespace)
+
+    def select_communities(self, query_str, query_embedding=None):
+        """
+        Ids of the communities to answer a query from, best first: the communities (restricted to the
+        configured level) of the entities relevant to the query, or every community with global_search
+        if there are none, ranked by the similarity of their summary to the query and capped at
+        max_communities. A query embedding already computed (for the query cache) is reused.
+        """
+        with instrumentation.span("query.retrieval"):
+            if query_embedding is None:
+                embed_model = self.embed_model or self.index._embed_model
+                query_embedding = embed_model.get_query_embedding(query_str)
+            entities = self.get_entities(query_str, self.similarity_top_k, query_embedding)
+
+        community_ids = self.retrieve_entity_communities(
+            self.graph_store.entity_index, entities
+        )
+        level_ids = self.graph_store.communities_at_level(self.level) if self.level is not None else None
+        if level_ids is not None:
+            community_ids = [id for id in community_ids if id in level_ids]
+        if not community_ids and self.global_search:
+            community_ids = list(level_ids if level_ids is not None else self.graph_store.community_summary)
+            print(f"No entity communities found for the query, ranking all {len(community_ids)} communities.")
+            instrumentation.count("query_global_searches")
+
+        with instrumentation.span("query.rank"):
+            return self.rank_communities(query_embedding, community_ids)
 
-        enitites = set()
-        pattern = (
-            r"^(\w+(?:\s+\w+)*)\s*->\s*([a-zA-Z\s]+?)\s*->\s*(\w+(?:\s+\w+)*)$"
+    def rank_communities(self, query_embedding, community_ids):
+        """
+        Keep the max_communities communities whose summary embedding is the most similar to the query,
+        above community_threshold, best first. Communities without an embedding (summarized before
+        summaries were embedded) cannot be ranked and fill the remaining places.
+        """
+        ranked = self.graph_store.rank_communities(
+            query_embedding, community_ids, top_n=self.max_communities, threshold=self.community_threshold
         )
+        selected = [id for id, _ in ranked]
+        selected.extend(id for id in community_ids if id not in self.graph_store.community_embedding)
+        if self.max_communities is not None:
+            selected = selected[:self.max_communities]
+        instrumentation.count("query_communities_pruned", len(community_ids) - len(selected))
+        return selected
 
-        for node in nodes_retrieved:
-            matches = re.findall(
-                pattern, node.text, re.MULTILINE | re.IGNORECASE
+    def get_entities(self, query_str, similarity_top_k, query_embedding=None):
+        """
+        Return the ids (names) of the entities relevant to a query, read straight from the property graph:
+        the top-k entities by embedding similarity plus their direct neighbours.
+        """
+        if query_embedding is None:
+            embed_model = self.embed_model or self.index._embed_model
+            query_embedding = embed_model.get_query_embedding(query_str)
+        if self.vector_index is not None:
+            entity_ids, _ = self.vector_index.query(query_embedding, similarity_top_k)
+            # get_rel_map only needs the ids, and an entity's id is its name
+            kg_nodes = [EntityNode(name=entity_id) for entity_id in entity_ids]
+        else:
+            query = VectorStoreQuery(
+                query_embedding=query_embedding,
+                similarity_top_k=similarity_top_k,
             )
+            kg_nodes, _ = self.graph_store.vector_query(query)
+        if not kg_nodes:
+            return []
 
-            for match in matches:
-                subject = match[0]
-                obj = match[2]
-                enitites.add(subject)
-                enitites.add(obj)
+        entities = {node.id for node in kg_nodes}
+        triplets = self.graph_store.get_rel_map(
+            kg_nodes, depth=1, limit=self.rel_map_limit, ignore_rels=[KG_SOURCE_REL]
+        )
+        for source, _, target in triplets:
+            entities.add(source.id)
+            entities.add(target.id)
 
-        return list(enitites)
+        return list(entities)
 
-    def retrieve_entity_communities(self, entity_info, entities):
+    def retrieve_entity_communities(self, entity_index, entities):
         """
         Retrieve cluster information for given entities, allowing for multiple clusters per entity.
 
         Args:
-        entity_info (dict): Dictionary mapping entities to their cluster IDs (list).
+        entity_index (dict): Dictionary mapping normalized entity names to their cluster IDs (list).
         entities (list): List of entity names to retrieve information for.
 
         Returns:
         List of community or cluster IDs to which an entity belongs.
         """
-        community_ids = []
+        community_ids = set()
 
         for entity in entities:
-            if entity in entity_info:
-                community_ids.extend(entity_info[entity])
+            community_ids.update(entity_index.get(normalize_entity_name(entity), ()))
 
-        return list(set(community_ids))
+        return list(community_ids)
 
-    def generate_answer_from_summary(self, community_summary, query):
-        """Generate an answer from a community summary based on a given query using LLM."""
+    def _answer_messages(self, community_summary, query):
         prompt = (
             f"Given the community summary: {community_summary}, "
             f"how would you answer the following query? Query: {query}"
@@ -88,21 +299,82 @@ class GraphRAGQueryEngine(CustomQueryEngine):
                 content="I need an answer based on the above information.",
             ),
         ]
-        response = self.llm.chat(messages)
+        return messages
+
+    def generate_answer_from_summary(self, community_summary, query):
+        """Generate an answer from a community summary based on a given query using LLM."""
+        messages = self._answer_messages(community_summary, query)
+        with instrumentation.llm_call("query.map") as call:
+            call.prompt_chars = message_chars(messages)
+            response = self.llm.chat(messages)
+            call.response_chars = len(str(response))
         cleaned_response = re.sub(r"^assistant:\s*", "", str(response)).strip()
         return cleaned_response
 
-    def aggregate_answers(self, community_answers):
-        """Aggregate individual community answers into a final, coherent response."""
+    async def agenerate_answer_from_summary(self, community_summary, query):
+        """Async version of generate_answer_from_summary."""
+        messages = self._answer_messages(community_summary, query)
+        with instrumentation.llm_call("query.map") as call:
+            call.prompt_chars = message_chars(messages)
+            response = await self.llm.achat(messages)
+            call.response_chars = len(str(response))
+        cleaned_response = re.sub(r"^assistant:\s*", "", str(response)).strip()
+        return cleaned_response
+
+    def _aggregate_messages(self, community_answers):
         prompt = "Combine the following intermediate answers into a final, concise response."
-        messages = [
+        return [
             ChatMessage(role="system", content=prompt),
             ChatMessage(
                 role="user",
                 content=f"Intermediate answers: {community_answers}",
             ),
         ]
-        final_response = self.llm.chat(messages)
+
+    def aggregate_answers(self, community_answers):
+        """Aggregate individual community answers into a final, coherent response."""
+        messages = self._aggregate_messages(community_answers)
+        with instrumentation.llm_call("query.reduce") as call:
+            call.prompt_chars = message_chars(messages)
+            final_response = self.llm.chat(messages)
+            call.response_chars = len(str(final_response))
+        cleaned_final_response = re.sub(
+            r"^assistant:\s*", "", str(final_response)
+        ).strip()
+        return cleaned_final_response
+
+    def stream_aggregate_answers(self, community_answers):
+        """Streaming version of aggregate_answers that yields the final response token by token."""
+        messages = self._aggregate_messages(community_answers)
+        with instrumentation.llm_call("query.reduce") as call:
+            call.prompt_chars = message_chars(messages)
+            # The first tokens are held back until they can be told apart from an "assistant:" prefix
+            head = ""
+            for chunk in self.llm.stream_chat(messages):
+                if not chunk.delta:
+                    continue
+                call.response_chars += len(chunk.delta)
+                if head is None:
+                    yield chunk.delta
+                    continue
+                head += chunk.delta
+                text = head.lstrip()
+                if "assistant:".startswith(text) or (text.startswith("assistant:") and not text[len("assistant:"):].strip()):
+                    continue
+                head = None
+                yield re.sub(r"^assistant:\s*", "", text)
+            if head:
+                cleaned_head = re.sub(r"^assistant:\s*", "", head.lstrip())
+                if cleaned_head:
+                    yield cleaned_head
+
+    async def aaggregate_answers(self, community_answers):
+        """Async version of aggregate_answers."""
+        messages = self._aggregate_messages(community_answers)
+        with instrumentation.llm_call("query.reduce") as call:
+            call.prompt_chars = message_chars(messages)
+            final_response = await self.llm.achat(messages)
+            call.response_chars = len(str(final_response))
         cleaned_final_response = re.sub(
             r"^assistant:\s*", "", str(final_response)
         ).strip()
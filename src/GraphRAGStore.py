@@ -1,21 +1,18 @@
-import re
-import networkx as nx
-from graspologic.partition import hierarchical_leiden
-from collections import defaultdict
 from llama_index.llms.ollama import Ollama
-from llama_index.core.llms import ChatMessage
+from llama_index.core.graph_stores.types import EntityNode, ChunkNode
 from llama_index.graph_stores.neo4j import Neo4jPropertyGraphStore
+from CommunityStore import CommunityStore
+from UpsertBuffer import UpsertBuffer
+from Instrumentation import instrumentation
+
 
 """
-CITATION: 
-LlamaIndex Cookbook: GraphRAG Implementation with LlamaIndex - V2
-link: https://docs.llamaindex.ai/en/stable/examples/cookbooks/GraphRAG_v2/#graphragstore
+Neo4j backend of the GraphRAG store: the graph lives in a Neo4j database reached over bolt,
+and community summaries are persisted as nodes next to it.
 """
-
-class GraphRAGStore(Neo4jPropertyGraphStore):
-    community_summary = {}
-    entity_info = None
-    max_cluster_size = 5
+class GraphRAGStore(CommunityStore, Neo4jPropertyGraphStore):
+    # Label of the nodes that persist community summaries next to the graph itself
+    community_label = "__Community__"
     
     def __init__(
             self, 
@@ -24,94 +21,233 @@ class GraphRAGStore(Neo4jPropertyGraphStore):
             password="password", 
             url="bolt://localhost:7687", 
             database="neo4j",
+            summary_workers=4,
+            summary_retries=2,
+            embed_model=None,
+            upsert_batch_size=5000,
+            upsert_flush_interval=5.0,
         ):
+        # Extracted nodes and relations are buffered and written with batched UNWIND queries.
+        # Created before super().__init__, which already runs queries through structured_query.
+        self._upsert_buffer = UpsertBuffer(
+            self._write_nodes, self._write_relations,
+            batch_size=upsert_batch_size, flush_interval=upsert_flush_interval,
+        )
+        self._schema_stale = False
         super().__init__(username, password, url, database)
-        self.llm = llm
-
-
-    def generate_community_summary(self, text):
-        """Generate summary for a given text using an LLM."""
-        messages = [
-            ChatMessage(
-                role="system",
-                content=(
-                    "You are provided with a set of relationships from a knowledge graph, each represented as "
-                    "(relationship$$$$<source_entity>$$$$<target_entity>$$$$<relation>$$$$<relationship_description>)." 
-                    "Your task is to create a summary of these relationships. The summary should include the names of the entities involved and a concise synthesis "
-                    "of the relationship descriptions. The goal is to capture the most critical and relevant details that "
-                    "highlight the nature and significance of each relationship. Ensure that the summary is coherent and "
-                    "integrates the information in a way that emphasizes the key aspects of the relationships."
-                ),
-            ),
-            ChatMessage(role="user", content=text),
-        ]
-        response = self.llm.chat(messages)
-        clean_response = re.sub(r"^assistant:\s*", "", str(response)).strip()
-        return clean_response
-
-    def build_communities(self):
-        """Builds communities from the graph and summarizes them."""
-        nx_graph = self._create_nx_graph()
-        community_hierarchical_clusters = hierarchical_leiden(
-            nx_graph, max_cluster_size=self.max_cluster_size
+        self._init_communities(llm, summary_workers, summary_retries, embed_model)
+
+    def upsert_nodes(self, nodes):
+        self._upsert_buffer.add_nodes(nodes)
+
+    def upsert_relations(self, relations):
+        self._upsert_buffer.add_relations(relations)
+        self._compact_graph = None
+
+    def flush(self):
+        """Write every buffered node and relation to Neo4j."""
+        self._upsert_buffer.flush()
+
+    def report_upserts(self):
+        self._upsert_buffer.report()
+
+    def structured_query(self, query, param_map=None):
+        # Reads must see everything upserted so far
+        if self._upsert_buffer.pending:
+            self.flush()
+        return super().structured_query(query, param_map)
+
+    def get_schema(self, refresh=False):
+        # PropertyGraphIndex refreshes the schema after every insert, which costs more than the
+        # insert itself; defer the refresh until the schema is actually read
+        if refresh:
+            self._schema_stale = True
+            return self.structured_schema
+        if self._schema_stale:
+            self._schema_stale = False
+            self.refresh_schema()
+        return self.structured_schema
+
+    def _write_nodes(self, nodes):
+        """Write a batch of nodes with one UNWIND query per node type, in a single session."""
+        entity_rows = [{**node.dict(), "id": node.id} for node in nodes if isinstance(node, EntityNode)]
+        chunk_rows = [{**node.dict(), "id": node.id} for node in nodes if isinstance(node, ChunkNode)]
+        instrumentation.count("graph_nodes_written", len(nodes))
+        with instrumentation.span("graph_write", kind="nodes"), self._driver.session(database=self._database) as session:
+            if chunk_rows:
+                session.execute_write(
+                    self._run_unwind,
+                    """
+                    UNWIND $data AS row
+                    MERGE (c:`__Node__` {id: row.id})
+                    SET c.text = row.text, c:Chunk
+                    WITH c, row
+                    SET c += row.properties
+                    WITH c, row.embedding AS embedding
+                    WHERE embedding IS NOT NULL
+                    CALL db.create.setNodeVectorProperty(c, 'embedding', embedding)
+                    RETURN count(*)
+                    """,
+                    chunk_rows,
+                )
+            if entity_rows:
+                session.execute_write(
+                    self._run_unwind,
+                    """
+                    UNWIND $data AS row
+                    MERGE (e:`__Node__` {id: row.id})
+                    SET e += apoc.map.clean(row.properties, [], [])
+                    SET e.name = row.name, e:`__Entity__`
+                    WITH e, row
+                    CALL apoc.create.addLabels(e, [row.label])
+                    YIELD node
+                    WITH e, row
+                    CALL (e, row) {
+                        WITH e, row
+                        WHERE row.embedding IS NOT NULL
+                        CALL db.create.setNodeVectorProperty(e, 'embedding', row.embedding)
+                        RETURN count(*) AS count
+                    }
+                    WITH e, row WHERE row.properties.triplet_source_id IS NOT NULL
+                    MERGE (c:`__Node__` {id: row.properties.triplet_source_id})
+                    MERGE (e)<-[:MENTIONS]-(c)
+                    """,
+                    entity_rows,
+                )
+
+    def _write_relations(self, relations):
+        """Write a batch of relations with a single UNWIND query."""
+        instrumentation.count("graph_relations_written", len(relations))
+        with instrumentation.span("graph_write", kind="relations"), self._driver.session(database=self._database) as session:
+            session.execute_write(
+                self._run_unwind,
+                """
+                UNWIND $data AS row
+                MERGE (source:`__Node__` {id: row.source_id})
+                ON CREATE SET source:Chunk
+                MERGE (target:`__Node__` {id: row.target_id})
+                ON CREATE SET target:Chunk
+                WITH source, target, row
+                CALL apoc.merge.relationship(source, row.label, {}, row.properties, target) YIELD rel
+                RETURN count(*)
+                """,
+                [relation.dict() for relation in relations],
+            )
+
+    @staticmethod
+    def _run_unwind(tx, query, rows):
+        tx.run(query, data=rows).consume()
+
+    def _iter_edge_pages(self):
+        """
+        Stream every entity -> entity relationship out of Neo4j as (source, target, relation) tuples,
+        in pages of edge_page_size. Descriptions are not fetched here.
+        """
+        self.flush()
+        query = (
+            "MATCH (e:`__Entity__`)-[r]->(t:`__Entity__`) "
+            "RETURN e.id AS source, t.id AS target, type(r) AS relation"
         )
-        self.entity_info, community_info = self._collect_community_info(
-            nx_graph, community_hierarchical_clusters
+        with self._driver.session(database=self._database, fetch_size=self.edge_page_size) as session:
+            page = []
+            for record in session.run(query):
+                page.append((record["source"], record["target"], record["relation"]))
+                if len(page) == self.edge_page_size:
+                    yield page
+                    page = []
+            if page:
+                yield page
+
+    def iter_entity_embeddings(self):
+        """Stream the embedded entities out of Neo4j in pages of edge_page_size."""
+        self.flush()
+        query = (
+            "MATCH (e:`__Entity__`) WHERE e.embedding IS NOT NULL "
+            "RETURN e.id AS id, e.embedding AS embedding"
         )
-        self._summarize_communities(community_info)
-
-    def _create_nx_graph(self):
-        """Converts internal graph representation to NetworkX graph."""
-        nx_graph = nx.Graph()
-        triplets = self.get_triplets()
-        for entity1, relation, entity2 in triplets:
-            relationship_desc = relation.properties.get("relationship_description", "relationship_description_dummy")
-            nx_graph.add_node(entity1.name)
-            nx_graph.add_node(entity2.name)
-            nx_graph.add_edge(
-                relation.source_id,
-                relation.target_id,
-                relationship=relation.label,
-                description=relationship_desc,
+        with self._driver.session(database=self._database, fetch_size=self.edge_page_size) as session:
+            page = []
+            for record in session.run(query):
+                page.append((record["id"], record["embedding"]))
+                if len(page) == self.edge_page_size:
+                    yield page
+                    page = []
+            if page:
+                yield page
+
+    def _fetch_edge_descriptions(self, edges):
+        """Returns {(source, target, relation): relationship_description} for the given edges."""
+        records = self.structured_query(
+            """
+            UNWIND $edges AS edge
+            MATCH (e:`__Entity__` {id: edge[0]})-[r]->(t:`__Entity__` {id: edge[1]})
+            WHERE type(r) = edge[2]
+            RETURN edge[0] AS source, edge[1] AS target, edge[2] AS relation,
+                   r.relationship_description AS description
+            """,
+            param_map={"edges": [list(edge) for edge in set(edges)]},
+        )
+        return {
+            (record["source"], record["target"], record["relation"]): record["description"]
+            for record in records
+        }
+
+    def _merge_entities(self, groups):
+        """
+        Merge every alias entity into its canonical entity with apoc.refactor.mergeNodes (APOC is
+        already required by the upstream store). The canonical node keeps its properties, duplicate
+        relationships are merged, and relationships between merged names are deleted.
+        """
+        rows = [{"target": target, "aliases": aliases} for target, aliases in groups.items()]
+        for start in range(0, len(rows), 1000):
+            self.structured_query(
+                """
+                UNWIND $rows AS row
+                MATCH (target:`__Entity__` {id: row.target})
+                MATCH (alias:`__Entity__`) WHERE alias.id IN row.aliases
+                WITH target, collect(alias) AS aliases
+                CALL apoc.refactor.mergeNodes([target] + aliases, {properties: "discard", mergeRels: true})
+                YIELD node
+                OPTIONAL MATCH (node)-[loop]->(node)
+                DELETE loop
+                """,
+                param_map={"rows": rows[start:start + 1000]},
             )
-        return nx_graph
 
-    def _collect_community_info(self, nx_graph, clusters):
+    def has_graph(self):
+        """Returns True if the database already contains extracted entities."""
+        result = self.structured_query("MATCH (e:`__Entity__`) RETURN count(e) > 0 AS found")
+        return bool(result and result[0]["found"])
+
+    def save_communities(self):
         """
-        Collect information for each node based on their community,
-        allowing entities to belong to multiple clusters.
+        Persist the community summaries and the entity -> community map as community nodes in Neo4j,
+        replacing any previously saved communities. Each community node stores its summary, its
+        place in the hierarchy, the names of its member entities and the embedding of its summary.
         """
-        entity_info = defaultdict(set)
-        community_info = defaultdict(list)
-
-        for item in clusters:
-            node = item.node
-            cluster_id = item.cluster
-
-            entity_info[node].add(cluster_id)
-
-            for neighbor in nx_graph.neighbors(node):
-                edge_data = nx_graph.get_edge_data(node, neighbor)
-                if edge_data:
-                    detail = f"{node} -> {neighbor} -> {edge_data['relationship']} -> {edge_data['description']}"
-                    community_info[cluster_id].append(detail)
-
-        entity_info = {k: list(v) for k, v in entity_info.items()}
-
-        return dict(entity_info), dict(community_info)
-
-    def _summarize_communities(self, community_info):
-        """Generate and store summaries for each community."""
-        for community_id, details in community_info.items():
-            details_text = (
-                "\n".join(details) + "."
-            )  
-            self.community_summary[
-                community_id
-            ] = self.generate_community_summary(details_text)
-
-    def get_community_summaries(self):
-        """Returns the community summaries, building them if not already done."""
-        if not self.community_summary:
-            self.build_communities()
-        return self.community_summary
\ No newline at end of file
+        rows = self._community_rows()
+        self.structured_query(f"MATCH (c:`{self.community_label}`) DETACH DELETE c")
+        for start in range(0, len(rows), 1000):
+            self.structured_query(
+                f"""
+                UNWIND $rows AS row
+                CREATE (c:`{self.community_label}` {{
+                    id: row.id, summary: row.summary, level: row.level, parent: row.parent, entities: row.entities,
+                    embedding: row.embedding
+                }})
+                """,
+                param_map={"rows": rows[start:start + 1000]},
+            )
+
+    def load_communities(self):
+        """
+        Reload community summaries and the entity -> community map saved by save_communities.
+        Returns True if any communities were found.
+        """
+        records = self.structured_query(
+            f"""
+            MATCH (c:`{self.community_label}`)
+            RETURN c.id AS id, c.summary AS summary, c.level AS level, c.parent AS parent, c.entities AS entities, c.embedding AS embedding
+            """
+        )
+        return self._restore_communities(records)
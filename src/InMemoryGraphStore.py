@@ -0,0 +1,491 @@
+import os
+import json
+import numpy as np
+from array import array
+from collections import defaultdict
+from llama_index.llms.ollama import Ollama
+from llama_index.core.graph_stores.types import PropertyGraphStore, EntityNode, ChunkNode, Relation
+from CommunityStore import CommunityStore
+
+
+"""
+In-process backend of the GraphRAG store, for experiments, tests and small deployments that should
+not need a Neo4j server. Node ids are interned to integer rows; relations are parallel int32 arrays
+(source row, target row, label id) with an incident-relation list per node; entity embeddings are
+kept normalized in a single float32 matrix. Upserts follow the Neo4j backend's semantics: nodes are
+merged by id, and a (source, label, target) relation keeps the properties it was created with.
+With a snapshot_path, the whole store (graph and communities) is persisted to one .npz file and
+reloaded on startup. Flushes that only add nodes and relations (every ingestion batch) append them
+to a JSON-lines journal next to it instead of rewriting the snapshot; the snapshot is rewritten
+after deletes, merges or new communities, and once the journal outgrows it.
+"""
+class InMemoryGraphStore(CommunityStore, PropertyGraphStore):
+    supports_structured_queries = False
+    supports_vector_queries = True
+
+    def __init__(
+            self,
+            llm=Ollama("qwen2.5"),
+            snapshot_path=None,
+            summary_workers=4,
+            summary_retries=2,
+            embed_model=None,
+        ):
+        self._init_communities(llm, summary_workers, summary_retries, embed_model)
+        self.snapshot_path = snapshot_path
+        self._clear()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+            self._replay_journal()
+
+    def _clear(self):
+        # Node row -> id (None once deleted) and node object, without its embedding (None for
+        # placeholder rows that were only referenced by a relation)
+        self._node_ids = []
+        self._nodes = []
+        self._node_rows = {}
+        # Normalized embeddings by node row, grown by doubling
+        self._vectors = None
+        self._has_vector = np.zeros(0, dtype=bool)
+        # Relations as parallel arrays, plus their properties and liveness
+        self._rel_sources = array("i")
+        self._rel_targets = array("i")
+        self._rel_labels = array("i")
+        self._rel_alive = bytearray()
+        self._rel_properties = []
+        self._label_names = []
+        self._label_ids = {}
+        self._rel_rows = {}
+        self._incident = defaultdict(list)
+        self._communities = []
+        self._dirty = False
+        # Upserts since the last flush, as journal records, and whether only a full snapshot can persist the changes
+        self._journal = []
+        self._needs_snapshot = True
+
+    @property
+    def client(self):
+        return self
+
+    def _intern_node(self, node_id):
+        row = self._node_rows.get(node_id)
+        if row is None:
+            row = self._node_rows[node_id] = len(self._node_ids)
+            self._node_ids.append(node_id)
+            self._nodes.append(None)
+        return row
+
+    def _set_vector(self, row, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        if self._vectors is None:
+            self._vectors = np.zeros((max(16, row + 1), len(vector)), dtype=np.float32)
+            self._has_vector = np.zeros(len(self._vectors), dtype=bool)
+        if row >= len(self._vectors):
+            capacity = max(row + 1, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._has_vector = np.concatenate([self._has_vector, np.zeros(capacity - len(self._has_vector), dtype=bool)])
+        self._vectors[row] = vector
+        self._has_vector[row] = True
+
+    def upsert_nodes(self, nodes):
+        journaled = []
+        for node in nodes:
+            if not isinstance(node, (EntityNode, ChunkNode)):
+                continue
+            if self.snapshot_path:
+                journaled.append(self._dump_node(node))
+            row = self._intern_node(node.id)
+            if node.embedding is not None:
+                self._set_vector(row, node.embedding)
+            stored = node.model_copy(update={"embedding": None, "properties": dict(node.properties)})
+            existing = self._nodes[row]
+            if existing is not None:
+                stored.properties = {**existing.properties, **stored.properties}
+            self._nodes[row] = stored
+        if journaled:
+            self._journal.append({"nodes": journaled})
+        self._dirty = True
+
+    def upsert_relations(self, relations):
+        journaled = []
+        for relation in relations:
+            if self.snapshot_path:
+                journaled.append(relation.model_dump())
+            source = self._intern_node(relation.source_id)
+            target = self._intern_node(relation.target_id)
+            label = self._label_ids.get(relation.label)
+            if label is None:
+                label = self._label_ids[relation.label] = len(self._label_names)
+                self._label_names.append(relation.label)
+            self._add_relation(source, target, label, dict(relation.properties))
+        if journaled:
+            self._journal.append({"relations": journaled})
+        self._compact_graph = None
+        self._dirty = True
+
+    def _add_relation(self, source, target, label, properties):
+        key = (source, target, label)
+        if key in self._rel_rows:
+            return
+        rel_row = self._rel_rows[key] = len(self._rel_sources)
+        self._rel_sources.append(source)
+        self._rel_targets.append(target)
+        self._rel_labels.append(label)
+        self._rel_alive.append(1)
+        self._rel_properties.append(properties)
+        self._incident[source].append(rel_row)
+        if target != source:
+            self._incident[target].append(rel_row)
+
+    def _node(self, row):
+        """The stored node of a row, with a placeholder chunk node for rows only seen in relations."""
+        node = self._nodes[row]
+        return node if node is not None else ChunkNode(text="", id_=self._node_ids[row])
+
+    def _relation(self, rel_row):
+        return Relation(
+            label=self._label_names[self._rel_labels[rel_row]],
+            source_id=self._node_ids[self._rel_sources[rel_row]],
+            target_id=self._node_ids[self._rel_targets[rel_row]],
+            properties=self._rel_properties[rel_row],
+        )
+
+    def _triplet(self, rel_row):
+        return [
+            self._node(self._rel_sources[rel_row]),
+            self._relation(rel_row),
+            self._node(self._rel_targets[rel_row]),
+        ]
+
+    def _is_entity(self, row):
+        return isinstance(self._nodes[row], EntityNode)
+
+    @staticmethod
+    def _matches(node, properties):
+        return all(node.properties.get(key) == value for key, value in properties.items())
+
+    def get(self, properties=None, ids=None):
+        if ids is not None:
+            rows = [self._node_rows[node_id] for node_id in ids if node_id in self._node_rows]
+        else:
+            rows = range(len(self._nodes))
+        nodes = [self._nodes[row] for row in rows if self._nodes[row] is not None]
+        if properties:
+            nodes = [node for node in nodes if self._matches(node, properties)]
+        return nodes
+
+    def get_triplets(self, entity_names=None, relation_names=None, properties=None, ids=None):
+        if not entity_names and not relation_names and not properties and not ids:
+            return []
+        if entity_names or ids:
+            seeds = {self._node_rows[name] for name in (entity_names or []) + (ids or []) if name in self._node_rows}
+            rel_rows = sorted({rel_row for row in seeds for rel_row in self._incident.get(row, ())})
+        else:
+            rel_rows = range(len(self._rel_sources))
+
+        label_ids = None
+        if relation_names:
+            label_ids = {self._label_ids[name] for name in relation_names if name in self._label_ids}
+        triplets = []
+        for rel_row in rel_rows:
+            source, target = self._rel_sources[rel_row], self._rel_targets[rel_row]
+            if not self._rel_alive[rel_row] or not (self._is_entity(source) and self._is_entity(target)):
+                continue
+            if label_ids is not None and self._rel_labels[rel_row] not in label_ids:
+                continue
+            if properties and not self._matches(self._nodes[source], properties):
+                continue
+            triplets.append(self._triplet(rel_row))
+        return triplets
+
+    def get_rel_map(self, graph_nodes, depth=2, limit=30, ignore_rels=None):
+        """Triplets reachable from graph_nodes within depth hops, in breadth-first order, up to limit."""
+        ignored = {self._label_ids[label] for label in (ignore_rels or []) if label in self._label_ids}
+        frontier = [self._node_rows[node.id] for node in graph_nodes if node.id in self._node_rows]
+        visited = set(frontier)
+        seen_relations = set()
+        triplets = []
+        for _ in range(depth):
+            next_frontier = []
+            for row in frontier:
+                for rel_row in self._incident.get(row, ()):
+                    if rel_row in seen_relations or not self._rel_alive[rel_row] or self._rel_labels[rel_row] in ignored:
+                        continue
+                    seen_relations.add(rel_row)
+                    triplets.append(self._triplet(rel_row))
+                    if len(triplets) >= limit:
+                        return triplets
+                    source, target = self._rel_sources[rel_row], self._rel_targets[rel_row]
+                    neighbour = target if source == row else source
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return triplets
+
+    def delete(self, entity_names=None, relation_names=None, properties=None, ids=None):
+        if relation_names:
+            label_ids = {self._label_ids[name] for name in relation_names if name in self._label_ids}
+            for rel_row, label in enumerate(self._rel_labels):
+                if label in label_ids:
+                    self._kill_relation(rel_row)
+
+        rows = set()
+        for name in entity_names or []:
+            row = self._node_rows.get(name)
+            if row is not None and self._is_entity(row):
+                rows.add(row)
+        for node_id in ids or []:
+            if node_id in self._node_rows:
+                rows.add(self._node_rows[node_id])
+        if properties:
+            rows.update(
+                row for row, node in enumerate(self._nodes)
+                if node is not None and self._matches(node, properties)
+            )
+        for row in rows:
+            for rel_row in self._incident.pop(row, ()):
+                self._kill_relation(rel_row)
+            del self._node_rows[self._node_ids[row]]
+            self._node_ids[row] = None
+            self._nodes[row] = None
+            if row < len(self._has_vector):
+                self._has_vector[row] = False
+        self._compact_graph = None
+        self._dirty = True
+        self._needs_snapshot = True
+
+    def _merge_entities(self, groups):
+        """
+        Move the relations of every alias onto its canonical entity, then delete the alias. Like
+        apoc.refactor.mergeNodes in the Neo4j backend, the canonical entity keeps its own properties
+        and a relation it already has keeps its properties; relations between merged names are dropped.
+        """
+        for canonical, aliases in groups.items():
+            target_row = self._node_rows[canonical]
+            merged_rows = {target_row}
+            for alias in aliases:
+                row = self._node_rows.get(alias)
+                if row is None:
+                    continue
+                merged_rows.add(row)
+                if row < len(self._has_vector) and self._has_vector[row] and not (
+                    target_row < len(self._has_vector) and self._has_vector[target_row]
+                ):
+                    self._set_vector(target_row, self._vectors[row])
+                for rel_row in self._incident.get(row, ()):
+                    if not self._rel_alive[rel_row]:
+                        continue
+                    source, target = self._rel_sources[rel_row], self._rel_targets[rel_row]
+                    source = target_row if source in merged_rows else source
+                    target = target_row if target in merged_rows else target
+                    properties = self._rel_properties[rel_row]
+                    self._kill_relation(rel_row)
+                    if source == target == target_row and self._is_entity(target_row):
+                        continue
+                    self._add_relation(source, target, self._rel_labels[rel_row], properties)
+            self.delete(ids=[alias for alias in aliases if alias in self._node_rows])
+        self._compact_graph = None
+        self._dirty = True
+        self._needs_snapshot = True
+
+    def _kill_relation(self, rel_row):
+        if self._rel_alive[rel_row]:
+            self._rel_alive[rel_row] = 0
+            key = (self._rel_sources[rel_row], self._rel_targets[rel_row], self._rel_labels[rel_row])
+            self._rel_rows.pop(key, None)
+
+    def structured_query(self, query, param_map=None):
+        raise NotImplementedError("The in-memory graph store does not support structured queries.")
+
+    def vector_query(self, query, **kwargs):
+        """Top-k entity nodes by cosine similarity to the query embedding."""
+        if self._vectors is None or query.query_embedding is None:
+            return [], []
+        rows = np.flatnonzero(self._has_vector)
+        rows = np.array([row for row in rows if self._is_entity(row)], dtype=np.int64)
+        if len(rows) == 0:
+            return [], []
+        embedding = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm:
+            embedding = embedding / norm
+        scores = self._vectors[rows] @ embedding
+        k = min(query.similarity_top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self._nodes[rows[i]] for i in top], [float(scores[i]) for i in top]
+
+    def get_schema(self, refresh=False):
+        return {
+            "node_labels": sorted({node.label for node in self._nodes if node is not None}),
+            "relationship_types": list(self._label_names),
+        }
+
+    def _iter_edge_pages(self):
+        page = []
+        for rel_row in range(len(self._rel_sources)):
+            source, target = self._rel_sources[rel_row], self._rel_targets[rel_row]
+            if self._rel_alive[rel_row] and self._is_entity(source) and self._is_entity(target):
+                page.append((
+                    self._node_ids[source], self._node_ids[target], self._label_names[self._rel_labels[rel_row]]
+                ))
+                if len(page) == self.edge_page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def iter_entity_embeddings(self):
+        rows = [row for row in np.flatnonzero(self._has_vector) if self._is_entity(row)]
+        for start in range(0, len(rows), self.edge_page_size):
+            page_rows = rows[start:start + self.edge_page_size]
+            yield list(zip([self._node_ids[row] for row in page_rows], self._vectors[page_rows]))
+
+    def _fetch_edge_descriptions(self, edges):
+        descriptions = {}
+        for source, target, relation in set(edges):
+            key = (self._node_rows.get(source), self._node_rows.get(target), self._label_ids.get(relation))
+            rel_row = self._rel_rows.get(key)
+            if rel_row is not None:
+                descriptions[(source, target, relation)] = self._rel_properties[rel_row].get("relationship_description")
+        return descriptions
+
+    def has_graph(self):
+        return any(isinstance(node, EntityNode) for node in self._nodes)
+
+    def save_communities(self):
+        self._communities = self._community_rows()
+        self._dirty = True
+        self._needs_snapshot = True
+        self.flush()
+
+    def load_communities(self):
+        return self._restore_communities(self._communities)
+
+    def flush(self):
+        """
+        Persist the changes since the last flush: append the upserted nodes and relations to the
+        journal, or rewrite the snapshot if that cannot capture them or the journal got too large.
+        """
+        if not (self.snapshot_path and self._dirty):
+            return
+        journal_path = self._journal_path()
+        if self._needs_snapshot or not os.path.exists(self.snapshot_path):
+            self.save_snapshot(self.snapshot_path)
+            return
+        with open(journal_path, 'a', encoding='utf-8') as f:
+            for record in self._journal:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal = []
+        self._dirty = False
+        # Compacting once the journal is larger than the snapshot keeps the total work linear
+        if os.path.getsize(journal_path) > os.path.getsize(self.snapshot_path):
+            self.save_snapshot(self.snapshot_path)
+
+    def _journal_path(self):
+        return self.snapshot_path + ".journal"
+
+    @staticmethod
+    def _dump_node(node):
+        return {"type": "entity" if isinstance(node, EntityNode) else "chunk", **node.model_dump()}
+
+    @staticmethod
+    def _load_node(data):
+        return (EntityNode if data.pop("type") == "entity" else ChunkNode)(**data)
+
+    def _replay_journal(self):
+        """Apply the journal written after the snapshot was loaded; a torn last line is ignored."""
+        journal_path = self._journal_path()
+        if not os.path.exists(journal_path):
+            return
+        records = 0
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Whatever came after it cannot be appended to safely; rewrite on the next flush
+                    self._needs_snapshot = True
+                    break
+                if "nodes" in record:
+                    self.upsert_nodes([self._load_node(node) for node in record["nodes"]])
+                else:
+                    self.upsert_relations([Relation(**relation) for relation in record["relations"]])
+                records += 1
+        self._journal = []
+        self._dirty = self._needs_snapshot
+        print(f"Replayed {records} journal records from {journal_path}.")
+
+    def report_upserts(self):
+        print(f"In-memory graph: {len(self._node_rows)} nodes, {sum(self._rel_alive)} relations.")
+
+    def save_snapshot(self, path):
+        """Atomically write the live nodes, relations, embeddings and communities to a single .npz file."""
+        alive = np.frombuffer(bytes(self._rel_alive), dtype=np.uint8).astype(bool)
+        nodes = [None if node is None else self._dump_node(node) for node in self._nodes]
+        metadata = {
+            "node_ids": self._node_ids,
+            "nodes": nodes,
+            "label_names": self._label_names,
+            "rel_properties": [props for props, keep in zip(self._rel_properties, alive) if keep],
+            "communities": self._communities,
+        }
+        vectors = self._vectors[:len(self._node_ids)] if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            metadata=np.array(json.dumps(metadata)),
+            rel_sources=np.frombuffer(self._rel_sources, dtype=np.int32)[alive],
+            rel_targets=np.frombuffer(self._rel_targets, dtype=np.int32)[alive],
+            rel_labels=np.frombuffer(self._rel_labels, dtype=np.int32)[alive],
+            vectors=vectors,
+            has_vector=self._has_vector[:len(vectors)],
+        )
+        os.replace(tmp_path, path)
+        # Everything in the journal is in the snapshot now (replaying it again would be harmless)
+        if path == self.snapshot_path and os.path.exists(self._journal_path()):
+            os.remove(self._journal_path())
+        self._journal = []
+        self._needs_snapshot = False
+        self._dirty = False
+
+    def load_snapshot(self, path):
+        self._clear()
+        with np.load(path) as snapshot:
+            metadata = json.loads(str(snapshot["metadata"]))
+            rel_sources = snapshot["rel_sources"]
+            rel_targets = snapshot["rel_targets"]
+            rel_labels = snapshot["rel_labels"]
+            vectors = snapshot["vectors"]
+            has_vector = snapshot["has_vector"]
+
+        self._node_ids = metadata["node_ids"]
+        self._node_rows = {node_id: row for row, node_id in enumerate(self._node_ids) if node_id is not None}
+        self._nodes = [None if node is None else self._load_node(node) for node in metadata["nodes"]]
+        if len(vectors):
+            self._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            self._has_vector = has_vector.astype(bool)
+        self._label_names = metadata["label_names"]
+        self._label_ids = {label: i for i, label in enumerate(self._label_names)}
+        self._rel_sources = array("i", rel_sources.tolist())
+        self._rel_targets = array("i", rel_targets.tolist())
+        self._rel_labels = array("i", rel_labels.tolist())
+        self._rel_alive = bytearray([1]) * len(self._rel_sources)
+        self._rel_properties = metadata["rel_properties"]
+        for rel_row, key in enumerate(zip(self._rel_sources, self._rel_targets, self._rel_labels)):
+            self._rel_rows[key] = rel_row
+            self._incident[key[0]].append(rel_row)
+            if key[1] != key[0]:
+                self._incident[key[1]].append(rel_row)
+        self._communities = metadata["communities"]
+        self._needs_snapshot = False
+        print(f"Loaded in-memory graph snapshot from {path}: {len(self._node_rows)} nodes, {len(self._rel_sources)} relations.")
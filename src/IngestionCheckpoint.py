@@ -0,0 +1,83 @@
+import os
+import json
+
+"""
+Durable progress record for batched ingestion.
+The checkpoint is a small JSON-lines file: a header naming the corpus, then one line per ingested
+batch with its number and the arXiv ids that made it into the graph. Each batch only appends (and
+fsyncs) its own line, so recording a batch costs the same however much was ingested before it. A
+crashed or interrupted ingestion resumes by skipping the papers that were already processed.
+"""
+class IngestionCheckpoint():
+
+    def __init__(self, path, corpus, resume=True):
+        self.path = path
+        # The corpus the checkpoint belongs to; a checkpoint for a different corpus is ignored
+        self.corpus = corpus
+        self.batch = 0
+        self.processed_ids = set()
+        # Whether the file on disk is a valid checkpoint of this corpus that batches can be appended to
+        self._appendable = False
+        if resume:
+            self.load()
+        else:
+            self.reset()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            print(f"Ignoring unreadable checkpoint {self.path}")
+            return
+        if header.get("corpus") != self.corpus:
+            print(f"Ignoring checkpoint {self.path}: it was written for {header.get('corpus')}")
+            return
+        self._appendable = True
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line of an interrupted write; the file is rewritten on the next batch
+                self._appendable = False
+                break
+            self.batch = record["batch"]
+            self.processed_ids.update(record["ids"])
+        print(f"Resuming from checkpoint: {len(self.processed_ids)} papers already ingested in {self.batch} batches.")
+
+    def record_batch(self, batch_number, ids):
+        """Mark a batch of arXiv ids as ingested and durably append it to the checkpoint."""
+        if not self._appendable:
+            self._rewrite()
+        self.batch = batch_number
+        self.processed_ids.update(ids)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"batch": batch_number, "ids": list(ids)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self):
+        """Atomically start a fresh checkpoint file holding the progress recorded so far."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"corpus": self.corpus}) + "\n")
+            if self.processed_ids:
+                f.write(json.dumps({"batch": self.batch, "ids": sorted(self.processed_ids)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._appendable = True
+
+    def reset(self):
+        """Forget all progress, so the next ingestion starts from the beginning."""
+        self.batch = 0
+        self.processed_ids = set()
+        self._appendable = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,256 @@
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from collections import defaultdict
+
+"""
+Lightweight, process-wide instrumentation for the GraphRAG pipeline.
+Spans record the wall time of a stage (chunking, extraction, embedding, graph writes, Leiden,
+summarization, the query map/reduce...), counters accumulate event counts and sizes, and in-flight
+gauges track how many calls of a kind are running at once (and the maximum seen). LLM calls are
+accounted for with llm_call, which records the call count, prompt/response sizes and concurrency of
+a stage. Inside trace(), every finished span is also appended to a per-query trace.
+Metrics can be exported as JSON or in the Prometheus text format. Instrumentation is disabled by
+default; while disabled every method returns immediately or hands back a shared no-op object.
+"""
+
+
+def message_chars(messages):
+    """Total size of a list of chat messages, for llm_call prompt accounting."""
+    return sum(len(message.content or "") for message in messages)
+
+
+class _NoopCall():
+    """Stand-in for _LLMCall while instrumentation is disabled; attribute writes are discarded."""
+    # Read by in-place updates such as call.response_chars += n
+    prompt_chars = 0
+    response_chars = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NOOP_SPAN = contextlib.nullcontext()
+_NOOP_CALL = _NoopCall()
+# Spans of the trace being recorded in the current context (query), if any
+_current_trace = contextvars.ContextVar("graphrag_trace", default=None)
+
+
+class _Span():
+
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+        self.details = {}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation._finish_span(self, time.perf_counter() - self.start, exc_type is not None)
+        return False
+
+
+class _LLMCall(_Span):
+    """Span of one LLM call; set prompt_chars and response_chars inside the with block."""
+
+    def __init__(self, instrumentation, stage):
+        super().__init__(instrumentation, "llm." + stage, {})
+        self.stage = stage
+        self.prompt_chars = 0
+        self.response_chars = 0
+
+    def __enter__(self):
+        self.instrumentation._add_in_flight("llm", 1, stage=self.stage)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        instrumentation = self.instrumentation
+        instrumentation._add_in_flight("llm", -1, stage=self.stage)
+        instrumentation.count("llm_calls", stage=self.stage)
+        instrumentation.count("llm_prompt_chars", self.prompt_chars, stage=self.stage)
+        instrumentation.count("llm_response_chars", self.response_chars, stage=self.stage)
+        if exc_type is not None:
+            instrumentation.count("llm_errors", stage=self.stage)
+        self.details = {"prompt_chars": self.prompt_chars, "response_chars": self.response_chars}
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class Instrumentation():
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            # (name, labels) -> [count, total seconds, max seconds, errors]
+            self._spans = {}
+            self._counters = defaultdict(float)
+            # (name, labels) -> [current, max]
+            self._gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def span(self, name, **labels):
+        """Context manager timing a stage."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def llm_call(self, stage):
+        """Context manager accounting for one LLM call of a stage."""
+        if not self.enabled:
+            return _NOOP_CALL
+        return _LLMCall(self, stage)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    @contextlib.contextmanager
+    def in_flight(self, name, **labels):
+        """Context manager counting the calls of a kind that are running at the same time."""
+        if not self.enabled:
+            yield
+            return
+        self._add_in_flight(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self._add_in_flight(name, -1, **labels)
+
+    def _add_in_flight(self, name, delta, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            gauge = self._gauges.setdefault(key, [0, 0])
+            gauge[0] += delta
+            gauge[1] = max(gauge[1], gauge[0])
+
+    def _finish_span(self, span, seconds, failed):
+        key = self._key(span.name, span.labels)
+        with self._lock:
+            stats = self._spans.setdefault(key, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += failed
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["spans"].append({
+                "name": span.name,
+                **span.labels,
+                **span.details,
+                "start_ms": (span.start - trace["_start"]) * 1000,
+                "duration_ms": seconds * 1000,
+                "error": failed,
+            })
+
+    @contextlib.contextmanager
+    def trace(self, **attributes):
+        """
+        Record every span finished inside the block (including in tasks and threads started from it)
+        into a trace dict, which is yielded, or yield None while disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+        trace = {**attributes, "spans": [], "_start": time.perf_counter()}
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace["total_ms"] = (time.perf_counter() - trace.pop("_start")) * 1000
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "spans": [
+                    {"name": name, **dict(labels), "count": count, "total_seconds": total,
+                     "max_seconds": longest, "errors": errors}
+                    for (name, labels), (count, total, longest, errors) in self._spans.items()
+                ],
+                "counters": [
+                    {"name": name, **dict(labels), "value": value}
+                    for (name, labels), value in self._counters.items()
+                ],
+                "in_flight": [
+                    {"name": name, **dict(labels), "current": current, "max": highest}
+                    for (name, labels), (current, highest) in self._gauges.items()
+                ],
+            }
+
+    def to_json(self, path=None):
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    @staticmethod
+    def _prometheus_labels(labels):
+        if not labels:
+            return ""
+        escaped = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def to_prometheus(self, prefix="graphrag"):
+        """Metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            spans = sorted(self._spans.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        for metric, kind, index in (
+            ("stage_calls_total", "counter", 0),
+            ("stage_seconds_total", "counter", 1),
+            ("stage_seconds_max", "gauge", 2),
+            ("stage_errors_total", "counter", 3),
+        ):
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for (name, labels), stats in spans:
+                lines.append(f"{prefix}_{metric}{self._prometheus_labels((('stage', name),) + labels)} {stats[index]}")
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append(f"{prefix}_{name}_total{self._prometheus_labels(labels)} {value:g}")
+
+        for metric, index in (("in_flight", 0), ("in_flight_max", 1)):
+            lines.append(f"# TYPE {prefix}_{metric} gauge")
+            for (name, labels), values in gauges:
+                lines.append(f"{prefix}_{metric}{self._prometheus_labels((('kind', name),) + labels)} {values[index]}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every component; call instrumentation.enable() to start collecting
+instrumentation = Instrumentation()
@@ -0,0 +1,245 @@
+import time
+import asyncio
+import threading
+from typing import Any, List, Optional, Sequence
+import httpx
+from ollama import ResponseError
+from pydantic import PrivateAttr
+from llama_index.core.llms import LLM, LLMMetadata, ChatMessage, ChatResponse, CompletionResponse
+from llama_index.llms.ollama import Ollama
+
+"""
+Load-balanced pool of LLM backends serving the same model (e.g. several Ollama servers), used as a
+single LLM. Every call goes to the healthy backend with the fewest outstanding requests. A backend
+that fails with a connection error, a timeout or a server error is marked unhealthy and the call
+fails over to the next one. Async calls wait at most timeout seconds for each backend (and for each
+chunk of a stream), so a hung server is marked unhealthy and skipped right away instead of at the next
+health check; a call cancelled from outside (e.g. a query deadline) leaves the backend's health alone.
+A background thread probes every backend's /api/tags endpoint and puts recovered backends back into
+rotation. Streams only fail over before their first chunk.
+"""
+class LLMPool(LLM):
+    llms: List[LLM]
+    # Seconds between two health checks of every backend
+    health_check_interval: float = 10.0
+    health_check_timeout: float = 2.0
+    # Seconds an async call waits for a backend before failing over (None waits forever)
+    timeout: Optional[float] = None
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _outstanding: List[int] = PrivateAttr()
+    _healthy: List[bool] = PrivateAttr()
+    _calls: List[int] = PrivateAttr()
+    _failures: List[int] = PrivateAttr()
+    _turn: int = PrivateAttr(default=0)
+    _health_thread: Any = PrivateAttr(default=None)
+
+    def __init__(self, llms, **kwargs):
+        super().__init__(
+            llms=llms,
+            system_prompt=llms[0].system_prompt,
+            messages_to_prompt=llms[0].messages_to_prompt,
+            completion_to_prompt=llms[0].completion_to_prompt,
+            **kwargs,
+        )
+        self._outstanding = [0] * len(llms)
+        self._healthy = [True] * len(llms)
+        self._calls = [0] * len(llms)
+        self._failures = [0] * len(llms)
+
+    @classmethod
+    def from_endpoints(cls, model, base_urls, request_timeout=20000, **kwargs):
+        """A pool of Ollama clients of model, one per server URL."""
+        return cls([Ollama(model=model, base_url=url, request_timeout=request_timeout) for url in base_urls], **kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "LLMPool"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self.llms[0].metadata
+
+    # Health
+
+    @staticmethod
+    def _is_backend_failure(error):
+        """Errors that mean the backend, not the request, is at fault."""
+        if isinstance(error, ResponseError):
+            return error.status_code >= 500
+        return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+    def check_health(self):
+        """Probe every backend with GET /api/tags and update its health."""
+        for i, llm in enumerate(self.llms):
+            base_url = getattr(llm, "base_url", None)
+            if base_url is None:
+                continue
+            try:
+                healthy = httpx.get(f"{base_url.rstrip('/')}/api/tags", timeout=self.health_check_timeout).status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            with self._lock:
+                if healthy != self._healthy[i]:
+                    print(f"LLM backend {base_url} is {'back up' if healthy else 'down'}")
+                self._healthy[i] = healthy
+
+    def start_health_checks(self):
+        """Check the backends now, then every health_check_interval seconds in a daemon thread."""
+        self.check_health()
+        if self._health_thread is None:
+            def loop():
+                while True:
+                    time.sleep(self.health_check_interval)
+                    self.check_health()
+            self._health_thread = threading.Thread(target=loop, name="llm-pool-health", daemon=True)
+            self._health_thread.start()
+
+    # Routing
+
+    def _acquire(self, tried):
+        """Pick the backend for the next attempt: healthy first, then fewest outstanding requests, then in turn."""
+        with self._lock:
+            candidates = [i for i in range(len(self.llms)) if i not in tried]
+            self._turn += 1
+            i = min(
+                candidates,
+                key=lambda i: (not self._healthy[i], self._outstanding[i], (i - self._turn) % len(self.llms)),
+            )
+            self._outstanding[i] += 1
+            self._calls[i] += 1
+            return i
+
+    def _release(self, i, error=None):
+        with self._lock:
+            self._outstanding[i] -= 1
+            if error is not None:
+                self._failures[i] += 1
+                if self._healthy[i]:
+                    print(f"LLM backend {self._name(i)} failed ({type(error).__name__}), failing over")
+                self._healthy[i] = False
+            else:
+                self._healthy[i] = True
+
+    def _name(self, i):
+        return getattr(self.llms[i], "base_url", None) or str(i)
+
+    def _call(self, method, *args, **kwargs):
+        tried = set()
+        while True:
+            i = self._acquire(tried)
+            tried.add(i)
+            try:
+                result = getattr(self.llms[i], method)(*args, **kwargs)
+            except Exception as e:
+                if not self._is_backend_failure(e):
+                    self._release(i)
+                    raise
+                self._release(i, e)
+                if len(tried) == len(self.llms):
+                    raise
+                continue
+            self._release(i)
+            return result
+
+    async def _acall(self, method, *args, **kwargs):
+        tried = set()
+        while True:
+            i = self._acquire(tried)
+            tried.add(i)
+            try:
+                result = await asyncio.wait_for(getattr(self.llms[i], method)(*args, **kwargs), self.timeout)
+            except Exception as e:
+                if not self._is_backend_failure(e):
+                    self._release(i)
+                    raise
+                self._release(i, e)
+                if len(tried) == len(self.llms):
+                    raise
+                continue
+            except BaseException:
+                self._release(i)
+                raise
+            self._release(i)
+            return result
+
+    def _stream(self, method, *args, **kwargs):
+        tried = set()
+        while True:
+            i = self._acquire(tried)
+            tried.add(i)
+            started = False
+            error = None
+            try:
+                for item in getattr(self.llms[i], method)(*args, **kwargs):
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                if self._is_backend_failure(e):
+                    error = e
+                if started or error is None or len(tried) == len(self.llms):
+                    raise
+            finally:
+                self._release(i, error)
+
+    async def _astream(self, method, *args, **kwargs):
+        tried = set()
+        while True:
+            i = self._acquire(tried)
+            tried.add(i)
+            started = False
+            error = None
+            try:
+                stream = await asyncio.wait_for(getattr(self.llms[i], method)(*args, **kwargs), self.timeout)
+                try:
+                    while True:
+                        try:
+                            item = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        started = True
+                        yield item
+                finally:
+                    await stream.aclose()
+                return
+            except Exception as e:
+                if self._is_backend_failure(e):
+                    error = e
+                if started or error is None or len(tried) == len(self.llms):
+                    raise
+            finally:
+                self._release(i, error)
+
+    def report(self):
+        with self._lock:
+            for i in range(len(self.llms)):
+                print(
+                    f"LLM backend {self._name(i)}: {self._calls[i]} calls, {self._failures[i]} failures, "
+                    f"{'healthy' if self._healthy[i] else 'down'}"
+                )
+
+    # LLM interface
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._call("chat", messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._call("complete", prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._stream("stream_chat", messages, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._stream("stream_complete", prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self._acall("achat", messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self._acall("acomplete", prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._astream("astream_chat", messages, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._astream("astream_complete", prompt, formatted=formatted, **kwargs)
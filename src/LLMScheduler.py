@@ -0,0 +1,301 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ScheduledLLM import ScheduledLLM
+from Instrumentation import instrumentation
+
+"""
+Central scheduler for every LLM call of the pipeline (extraction, community summaries and queries),
+shared through ScheduledLLM wrappers of the same model.
+- Calls are admitted through one gate with a concurrency limit. Waiting calls are served by priority
+  (queries first, then summaries, then extraction), and queries may use interactive_slots slots on
+  top of the limit, so a user query never waits behind background work.
+- The limit adapts with AIMD: it grows by about one slot per limit successful calls, and is halved
+  when calls fail or time out. Latency alone is not a signal: it varies with the prompt and answer
+  length and with streams stopped early, so it says little about the server's load.
+- Every call has a timeout and is retried with exponential backoff and jitter. Async calls are
+  cancelled when they time out. Synchronous calls cannot be interrupted: they run in a thread pool,
+  the caller stops waiting at the timeout, and the abandoned call keeps its thread until it returns.
+The gate works across threads and event loops (Streamlit, asyncio.run, nest_asyncio).
+"""
+class LLMScheduler():
+    QUERY = 0
+    SUMMARY = 1
+    EXTRACTION = 2
+    PRIORITY_NAMES = {QUERY: "query", SUMMARY: "summary", EXTRACTION: "extraction"}
+
+    def __init__(
+            self,
+            max_concurrency=8,
+            min_concurrency=1,
+            initial_concurrency=None,
+            timeout=600.0,
+            max_retries=2,
+            backoff=1.0,
+            interactive_slots=1,
+            sync_workers=None,
+        ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial_concurrency or max(min_concurrency, max_concurrency // 2))
+        # Seconds per call attempt; None waits indefinitely
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.interactive_slots = interactive_slots
+
+        self._lock = threading.Lock()
+        self._running = 0
+        # Heap of (priority, sequence number, waiter)
+        self._waiting = []
+        self._sequence = itertools.count()
+        # Moving average of the call latency, per priority (prompts differ a lot between stages)
+        self._average = {}
+        self._last_decrease = 0.0
+        # Runs synchronous calls (and stream chunks), so that they can time out. Sized well above the
+        # admission limit, since a timed-out call keeps its thread after its slot is released.
+        self._executor = ThreadPoolExecutor(max_workers=sync_workers or 4 * (max_concurrency + interactive_slots))
+        self.reset_stats()
+
+    def wrap(self, llm, priority):
+        """An LLM that sends every call of llm through this scheduler with the given priority."""
+        return ScheduledLLM.create(llm, self, priority)
+
+    def reset_stats(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.max_waiting = 0
+
+    def report(self):
+        print(
+            f"LLM scheduler: {self.calls} calls, {self.retries} retries ({self.timeouts} timeouts), "
+            f"{self.failures} failed, concurrency limit {self.limit:.1f}, up to {self.max_waiting} calls waiting"
+        )
+
+    # Admission gate
+
+    def _capacity(self, priority):
+        capacity = int(self.limit)
+        if priority == self.QUERY:
+            capacity += self.interactive_slots
+        return capacity
+
+    def _try_admit(self, priority):
+        # Called with the lock held; waiting calls of the same or a higher priority go first
+        if self._running < self._capacity(priority) and (not self._waiting or self._waiting[0][0] > priority):
+            self._running += 1
+            return True
+        return False
+
+    def _enqueue(self, priority, waiter):
+        heapq.heappush(self._waiting, (priority, next(self._sequence), waiter))
+        self.max_waiting = max(self.max_waiting, len(self._waiting))
+
+    def _dispatch(self):
+        # Called with the lock held: admit waiting calls, best priority first, while there is capacity
+        while self._waiting:
+            priority, _, waiter = self._waiting[0]
+            if waiter["cancelled"]:
+                heapq.heappop(self._waiting)
+                continue
+            if self._running >= self._capacity(priority):
+                break
+            heapq.heappop(self._waiting)
+            self._running += 1
+            waiter["granted"] = True
+            if not waiter["wake"]():
+                # The waiter's event loop is gone, so it will never take the slot
+                waiter["cancelled"] = True
+                self._running -= 1
+
+    def _acquire(self, priority):
+        with self._lock:
+            if self._try_admit(priority):
+                return
+            event = threading.Event()
+            self._enqueue(priority, {"cancelled": False, "granted": False, "wake": lambda: event.set() or True})
+        event.wait()
+
+    async def _aacquire(self, priority):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+            except RuntimeError:
+                return False
+            return True
+
+        waiter = {"cancelled": False, "granted": False, "wake": wake}
+        with self._lock:
+            if self._try_admit(priority):
+                return
+            self._enqueue(priority, waiter)
+        try:
+            await future
+        except BaseException:
+            # Cancelled (or the loop is shutting down) while waiting
+            with self._lock:
+                waiter["cancelled"] = True
+                if waiter["granted"]:
+                    # The slot was handed over after the caller gave up; pass it on
+                    self._running -= 1
+                    self._dispatch()
+            raise
+
+    def _release(self, priority, latency, outcome):
+        """Free a slot and adapt the limit; outcome is "success", "error" or None (cancelled)."""
+        with self._lock:
+            self._running -= 1
+            now = time.monotonic()
+            if outcome == "error":
+                self._decrease(now, 0.5)
+            elif outcome == "success":
+                self._average[priority] = self._average.get(priority, latency) * 0.8 + latency * 0.2
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._dispatch()
+
+    def _decrease(self, now, factor):
+        # At most one decrease per average call duration, so that one burst of slow calls counts once
+        if now - self._last_decrease < max(self._average.values(), default=1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * factor)
+
+    # Calls
+
+    def _backoff_delay(self, attempt):
+        return self.backoff * 2 ** attempt * (0.5 + random.random())
+
+    def _record_failure(self, priority, error, attempt):
+        name = self.PRIORITY_NAMES.get(priority, str(priority))
+        if isinstance(error, TimeoutError):
+            self.timeouts += 1
+        if attempt == self.max_retries:
+            self.failures += 1
+            return True
+        self.retries += 1
+        instrumentation.count("llm_retries", priority=name)
+        return False
+
+    async def arun(self, priority, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) through the gate, with the timeout and retries."""
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire(priority)
+            start = time.perf_counter()
+            outcome = None
+            try:
+                result = await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+                outcome = "success"
+                return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                outcome = "error"
+                if self._record_failure(priority, e, attempt):
+                    raise
+            finally:
+                self._release(priority, time.perf_counter() - start, outcome)
+            await asyncio.sleep(self._backoff_delay(attempt))
+
+    def run(self, priority, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) through the gate, with the timeout and retries."""
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority)
+            start = time.perf_counter()
+            outcome = None
+            try:
+                result = self._executor.submit(fn, *args, **kwargs).result(self.timeout)
+                outcome = "success"
+                return result
+            except Exception as e:
+                outcome = "error"
+                if self._record_failure(priority, e, attempt):
+                    raise
+            finally:
+                self._release(priority, time.perf_counter() - start, outcome)
+            time.sleep(self._backoff_delay(attempt))
+
+    def stream(self, priority, fn, *args, **kwargs):
+        """
+        Iterate over the stream returned by fn(*args, **kwargs), holding a slot until it is exhausted
+        or closed. The timeout applies to the wait for every item. A stream is only retried if it
+        fails before its first item.
+        """
+        self.calls += 1
+        end = object()
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority)
+            start = time.perf_counter()
+            outcome = None
+            started = False
+            try:
+                stream = self._executor.submit(fn, *args, **kwargs).result(self.timeout)
+                iterator = iter(stream)
+                while True:
+                    item = self._executor.submit(next, iterator, end).result(self.timeout)
+                    if item is end:
+                        break
+                    started = True
+                    yield item
+                outcome = "success"
+                return
+            except GeneratorExit:
+                outcome = "success"
+                try:
+                    # Stop the underlying stream too, unless a timed-out item is still being produced
+                    getattr(iterator, "close", lambda: None)()
+                except ValueError:
+                    pass
+                raise
+            except Exception as e:
+                outcome = "error"
+                if started or self._record_failure(priority, e, attempt):
+                    raise
+            finally:
+                self._release(priority, time.perf_counter() - start, outcome)
+            time.sleep(self._backoff_delay(attempt))
+
+    async def astream(self, priority, fn, *args, **kwargs):
+        """Async version of stream; the timeout applies to the wait for every item."""
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire(priority)
+            start = time.perf_counter()
+            outcome = None
+            started = False
+            try:
+                stream = await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+                try:
+                    while True:
+                        try:
+                            item = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        started = True
+                        yield item
+                finally:
+                    await stream.aclose()
+                outcome = "success"
+                return
+            except GeneratorExit:
+                outcome = "success"
+                raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                outcome = "error"
+                if started or self._record_failure(priority, e, attempt):
+                    raise
+            finally:
+                self._release(priority, time.perf_counter() - start, outcome)
+            await asyncio.sleep(self._backoff_delay(attempt))
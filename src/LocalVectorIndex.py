@@ -0,0 +1,144 @@
+import os
+import json
+import numpy as np
+
+"""
+Local exact (or IVF-partitioned) vector index over precomputed embeddings, used to retrieve entities
+without a round trip to the graph store's vector search.
+Vectors are L2-normalized float32 rows, saved as a .npy file and memory-mapped on load; top-k is a
+matrix-vector product followed by np.argpartition. For large corpora the rows can be partitioned with
+spherical k-means into nlist inverted lists, stored contiguously, and only the nprobe lists whose
+centroids are closest to the query are scanned.
+"""
+class LocalVectorIndex():
+    # Corpora at least this large are partitioned automatically when nlist is not given
+    ivf_min_size = 100_000
+    kmeans_iterations = 10
+    # Rows multiplied against the centroids at once while assigning lists, to bound memory
+    assign_chunk_size = 65536
+
+    def __init__(self, ids, vectors, centroids=None, offsets=None, nprobe=32):
+        self.ids = ids
+        self.vectors = vectors
+        # IVF partition: centroid of every list, and row offsets so list i is vectors[offsets[i]:offsets[i + 1]]
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=None, nprobe=32, seed=0):
+        """
+        Build the index from ids and their embeddings. nlist=None partitions automatically
+        (about sqrt(n) lists) once there are ivf_min_size vectors; nlist=0 always scans every row.
+        """
+        ids = list(ids)
+        vectors = cls._normalize(vectors).reshape(len(ids), -1)
+        if nlist is None:
+            nlist = int(np.sqrt(len(ids))) if len(ids) >= cls.ivf_min_size else 0
+        if not nlist or len(ids) <= nlist:
+            return cls(ids, vectors, nprobe=nprobe)
+
+        centroids = cls._kmeans(vectors, nlist, seed)
+        assignments = cls._assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        return cls([ids[i] for i in order], vectors[order], centroids, offsets, nprobe)
+
+    @classmethod
+    def from_pages(cls, pages, **kwargs):
+        """Build the index from an iterable of pages of (id, embedding) pairs."""
+        ids, vectors = [], []
+        for page in pages:
+            for item_id, embedding in page:
+                ids.append(item_id)
+                vectors.append(np.asarray(embedding, dtype=np.float32))
+        if not ids:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        return cls.build(ids, np.stack(vectors), **kwargs)
+
+    @classmethod
+    def _assign(cls, vectors, centroids):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), cls.assign_chunk_size):
+            chunk = vectors[start:start + cls.assign_chunk_size]
+            assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignments
+
+    @classmethod
+    def _kmeans(cls, vectors, nlist, seed):
+        """Spherical k-means on a sample of at most 256 rows per list."""
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), 256 * nlist)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(cls.kmeans_iterations):
+            assignments = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            # Re-seed empty lists with random sample rows
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = cls._normalize(sums)
+        return centroids
+
+    def query(self, embedding, top_k=10):
+        """Returns the ids of the top_k most similar vectors and their cosine similarities, best first."""
+        if len(self.ids) == 0:
+            return [], []
+        embedding = self._normalize(embedding)
+        if self.centroids is not None:
+            nprobe = min(self.nprobe, len(self.centroids))
+            lists = np.argpartition(-(self.centroids @ embedding), nprobe - 1)[:nprobe]
+            rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+            scores = self.vectors[rows] @ embedding
+        else:
+            rows = None
+            scores = self.vectors @ embedding
+
+        k = min(top_k, len(scores))
+        if k == 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            return [self.ids[rows[i]] for i in top], scores[top].tolist()
+        return [self.ids[i] for i in top], scores[top].tolist()
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        ivf_path = os.path.join(path, "ivf.npz")
+        if self.centroids is not None:
+            np.savez(ivf_path, centroids=self.centroids, offsets=self.offsets)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+    @classmethod
+    def load(cls, path, nprobe=32):
+        """Load a saved index, memory-mapping the vectors instead of reading them into memory."""
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        centroids = offsets = None
+        ivf_path = os.path.join(path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                centroids, offsets = ivf["centroids"], ivf["offsets"]
+        return cls(ids, vectors, centroids, offsets, nprobe)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "vectors.npy"))
+
+    def __len__(self):
+        return len(self.ids)
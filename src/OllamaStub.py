@@ -0,0 +1,120 @@
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from FakeLLM import FakeLLM
+
+"""
+Local HTTP server mimicking the parts of the Ollama API used by the pipeline (/api/tags and
+/api/chat, streamed or not), answering with FakeLLM. Each stub works on at most parallel requests
+at a time and takes latency seconds per request, like a single Ollama server, so several stubs can
+stand in for a pool of LLM backends in tests and benchmarks.
+
+Usage: python src/OllamaStub.py --port 11500 --latency 0.5
+"""
+class OllamaStub():
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, parallel=1, model="fake-llm"):
+        self.latency = latency
+        self.model = model
+        self.requests = 0
+        self._fake_llm = FakeLLM()
+        self._slots = threading.Semaphore(parallel)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"ollama-stub-{self.url}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _message(self, content, done):
+        return {
+            "model": self.model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+            **({"done_reason": "stop", "prompt_eval_count": 0, "eval_count": 0} if done else {}),
+        }
+
+    def _answer(self, request):
+        prompt = "\n".join(message.get("content") or "" for message in request.get("messages", []))
+        with self._slots:
+            self.requests += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return self._fake_llm.respond(prompt)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": stub.model, "model": stub.model}]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self._send_json({"error": "not found"}, 404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                answer = stub._answer(request)
+                if not request.get("stream", True):
+                    self._send_json(stub._message(answer, True))
+                    return
+                # Streamed answers are sent as newline-delimited JSON, one word per line
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for word in answer.split(" "):
+                    self.wfile.write((json.dumps(stub._message(word + " ", False)) + "\n").encode("utf-8"))
+                self.wfile.write((json.dumps(stub._message("", True)) + "\n").encode("utf-8"))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub Ollama server answering with a deterministic fake LLM')
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=11500)
+    parser.add_argument('--latency', type=float, default=0.5,
+                      help='Seconds per request')
+    parser.add_argument('--parallel', type=int, default=1,
+                      help='Requests processed at the same time')
+    args = parser.parse_args()
+    stub = OllamaStub(args.host, args.port, args.latency, args.parallel)
+    print(f"Ollama stub listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 import polars as pl
+import io
 import os
 import json
+import time
+import itertools
+import contextlib
 import logging
+import argparse
 from typing import List
 
 # Set up logging
@@ -15,10 +20,32 @@ logger = logging.getLogger(__name__)
 DATASET_PATH = "/Users/agastyadas/.cache/kagglehub/datasets/Cornell-University/arxiv/versions/203"
 INPUT_FILE = "arxiv-metadata-oai-snapshot.json"
 OUTPUT_FILE = "datasets/arxiv_cs_metadata.json"
+# File extension written for each output format; arrow (IPC) files can be memory-mapped by the loader
+OUTPUT_EXTENSIONS = {"json": ".json", "parquet": ".parquet", "arrow": ".arrow"}
 CS_CATEGORIES = ['cs.CV', 'cs.LG', 'cs.CL', 'cs.AI', 'cs.NE', 'cs.RO']
 COLS = ["id", "submitter", "authors", "title", "comments", "journal-ref", "doi", "report-no?", "categories", "license?", "abstract", "versions", "update_date", "authors_parsed"]
 FILTERED_COLS = ["id", "submitter", "authors", "title", "comments", "journal-ref", "doi", "report-no?", "categories", "license?", "abstract", "versions", "update_date"]
 
+# Schema of the raw snapshot, so the lazy scan does not have to infer it
+RAW_SCHEMA = {
+    "id": pl.Utf8,
+    "submitter": pl.Utf8,
+    "authors": pl.Utf8,
+    "title": pl.Utf8,
+    "comments": pl.Utf8,
+    "journal-ref": pl.Utf8,
+    "doi": pl.Utf8,
+    "report-no": pl.Utf8,
+    "categories": pl.Utf8,
+    "license": pl.Utf8,
+    "abstract": pl.Utf8,
+    "versions": pl.List(pl.Struct({"version": pl.Utf8, "created": pl.Utf8})),
+    "update_date": pl.Utf8,
+    "authors_parsed": pl.List(pl.List(pl.Utf8)),
+}
+# Regex matching any of the CS categories we keep
+CATEGORY_PATTERN = r"\b(?:" + "|".join(CS_CATEGORIES).replace(".", r"\.") + r")\b"
+
 def clean_paper_data(row: dict) -> dict:
     """Clean and validate a single paper's data"""
     # Clean authors data
@@ -70,21 +97,141 @@ def clean_paper_data(row: dict) -> dict:
         'authors_parsed': authors_parsed
     }
 
-# Create output directory if it doesn't exist
-os.makedirs('datasets', exist_ok=True)
+def cleaned_columns() -> List[pl.Expr]:
+    """Columnar equivalent of clean_paper_data, as expressions over the raw snapshot columns"""
+    def string_field(name):
+        # str(value).strip(), so a missing value becomes "None" like in clean_paper_data
+        return pl.col(name).fill_null("None").str.strip_chars().alias(name)
+
+    def optional_string_field(name):
+        # clean_string_field: None and "None" both become ""
+        col = pl.col(name)
+        return (
+            pl.when(col.is_null() | (col == "None"))
+            .then(pl.lit(""))
+            .otherwise(col.str.strip_chars())
+            .alias(name)
+        )
+
+    versions = pl.col("versions").fill_null([]).list.eval(
+        pl.struct(
+            pl.element().struct.field("version").fill_null("").str.strip_chars().alias("version"),
+            pl.element().struct.field("created").fill_null("").str.strip_chars().alias("created"),
+        )
+    ).alias("versions")
+
+    authors = pl.col("authors_parsed").list.eval(
+        pl.element().list.eval(pl.element().fill_null("").str.strip_chars())
+    )
+    authors_parsed = (
+        pl.when(authors.is_null() | (authors.list.len() == 0))
+        .then(pl.lit([["Unknown", "", ""]], dtype=pl.List(pl.List(pl.Utf8))))
+        .otherwise(authors)
+        .alias("authors_parsed")
+    )
+
+    return [
+        string_field("id"),
+        string_field("submitter"),
+        string_field("authors"),
+        string_field("title"),
+        string_field("comments"),
+        optional_string_field("journal-ref"),
+        optional_string_field("doi"),
+        optional_string_field("report-no"),
+        string_field("categories"),
+        string_field("license"),
+        string_field("abstract"),
+        versions,
+        string_field("update_date"),
+        authors_parsed,
+    ]
+
+def complete_record_filter() -> pl.Expr:
+    """Columnar equivalent of all(cleaned_record.values()): no empty strings and at least one version"""
+    string_cols = [name for name in RAW_SCHEMA if name not in ("versions", "authors_parsed")]
+    return pl.all_horizontal(
+        *[pl.col(name).str.len_bytes() > 0 for name in string_cols],
+        pl.col("versions").list.len() > 0,
+    )
+
+def log_throughput(input_path: str, rows_written: int, elapsed: float):
+    input_mb = os.path.getsize(input_path) / 1e6
+    elapsed = max(elapsed, 1e-9)
+    logger.info(
+        f"Processed papers: {rows_written} in {elapsed:.1f}s "
+        f"({rows_written / elapsed:,.0f} rows/sec written, {input_mb / elapsed:,.1f} MB/sec of input)"
+    )
+
+def iter_raw_batches(input_path: str, batch_size: int):
+    """
+    Parse the snapshot batch_size lines at a time. Polars' streaming engine cannot stream an NDJSON
+    scan (collect(streaming=True) materializes it whole), so the file is cut into batches by hand.
+    """
+    with open(input_path, 'rb') as f:
+        while True:
+            lines = list(itertools.islice(f, batch_size))
+            if not lines:
+                return
+            yield pl.read_ndjson(io.BytesIO(b"".join(lines)), schema=RAW_SCHEMA, ignore_errors=True)
+
+def clean_batch(raw_df: pl.DataFrame) -> pl.DataFrame:
+    """Keep the CS papers of a raw batch and clean every column with polars expressions on all cores"""
+    return (
+        raw_df.lazy()
+        .filter(pl.col("categories").str.contains(CATEGORY_PATTERN, strict=True))
+        .select(cleaned_columns())
+        .filter(complete_record_filter())
+        .collect()
+    )
+
+def preprocess_streaming(input_path: str, output_path: str, batch_size: int = 50_000, output_format: str = "json") -> int:
+    """
+    Parse and clean the snapshot batch_size lines at a time, so only one batch of the raw snapshot
+    is ever in memory. JSON output is appended batch by batch. Parquet and arrow files cannot be
+    appended to, so the cleaned batches (the CS papers only) are kept and written at the end, in
+    row groups of batch_size rows for parquet.
+    """
+    logger.info(f"Reading ArXiv dataset in batches of {batch_size} lines from {input_path}...")
+    start = time.perf_counter()
+    written = 0
+    cleaned_batches = []
+    with open(output_path, 'wb') if output_format == "json" else contextlib.nullcontext() as f:
+        for raw_df in iter_raw_batches(input_path, batch_size):
+            cleaned_df = clean_batch(raw_df)
+            del raw_df
+            written += len(cleaned_df)
+            if output_format == "json":
+                cleaned_df.write_ndjson(f)
+            else:
+                cleaned_batches.append(cleaned_df)
+            logger.info(f"Processed papers: {written} written so far")
 
-try:
+    if output_format != "json":
+        logger.info(f"Writing {written} papers to {output_path}...")
+        cleaned_df = pl.concat(cleaned_batches) if cleaned_batches else clean_batch(pl.DataFrame(schema=RAW_SCHEMA))
+        del cleaned_batches
+        if output_format == "parquet":
+            cleaned_df.write_parquet(output_path, row_group_size=batch_size)
+        else:
+            # Uncompressed IPC so the loader can memory-map it directly
+            cleaned_df.write_ipc(output_path, compression="uncompressed")
+        del cleaned_df
+
+    elapsed = time.perf_counter() - start
+    log_throughput(input_path, written, elapsed)
+    return written
+
+def preprocess_eager(input_path: str, output_path: str) -> int:
+    """Original row-by-row preprocessing: loads the whole snapshot and cleans it in Python"""
     # Read the dataset
     logger.info("Reading ArXiv dataset...")
-    input_path = os.path.join(DATASET_PATH, INPUT_FILE)
+    start = time.perf_counter()
     df = pl.read_ndjson(input_path)
     
-    # Create category pattern for filtering
-    pattern = r"\b(?:" + "|".join(CS_CATEGORIES).replace(".", r"\.") + r")\b"
-    
     # Filter for CS categories
     logger.info("Filtering CS papers...")
-    filtered_df = df.filter(pl.col("categories").str.contains(pattern, strict=True))
+    filtered_df = df.filter(pl.col("categories").str.contains(CATEGORY_PATTERN, strict=True))
     
     # Select and clean needed columns
     logger.info("Processing papers...")
@@ -101,30 +248,74 @@ try:
             continue
     
     # Write the cleaned records to file
-    logger.info(f"Writing {len(processed_records)} papers to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+    logger.info(f"Writing {len(processed_records)} papers to {output_path}...")
+    with open(output_path, 'w', encoding='utf-8') as f:
         for record in processed_records:
             json.dump(record, f, ensure_ascii=False)
             f.write('\n')
     
-    logger.info("Successfully completed preprocessing!")
-    logger.info(f"Processed papers: {len(processed_records)}")
-
-except Exception as e:
-    logger.error(f"Error during preprocessing: {str(e)}")
-    raise
-
-# Verify the output
-try:
-    # Try reading back the processed file to verify
-    test_df = pl.read_ndjson(OUTPUT_FILE)
-    logger.info(f"Verification successful. Output file contains {len(test_df)} papers.")
+    elapsed = time.perf_counter() - start
+    log_throughput(input_path, len(processed_records), elapsed)
+    return len(processed_records)
+
+def scan_output(output_path: str) -> pl.LazyFrame:
+    if output_path.endswith(OUTPUT_EXTENSIONS["parquet"]):
+        return pl.scan_parquet(output_path)
+    if output_path.endswith(OUTPUT_EXTENSIONS["arrow"]):
+        return pl.scan_ipc(output_path, memory_map=True)
+    return pl.scan_ndjson(output_path)
+
+def verify_output(output_path: str):
+    # Try reading back the processed file to verify, without loading all of it
+    papers = scan_output(output_path)
+    count = papers.select(pl.len()).collect().item()
+    logger.info(f"Verification successful. Output file contains {count} papers.")
     
     # Show sample of the data
-    if len(test_df) > 0:
-        sample = test_df.head(1).to_dicts()[0]
+    if count > 0:
+        sample = papers.head(1).collect().to_dicts()[0]
         logger.info("Sample paper structure:")
         logger.info(json.dumps(sample, indent=2))
 
-except Exception as e:
-    logger.error(f"Error verifying output file: {str(e)}")
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description='Filter and clean the ArXiv snapshot down to CS papers')
+    parser.add_argument('-i', '--input', type=str, default=os.path.join(DATASET_PATH, INPUT_FILE),
+                      help='Path to the ArXiv metadata snapshot')
+    parser.add_argument('-o', '--output', type=str, default=OUTPUT_FILE,
+                      help='Path of the cleaned output file')
+    parser.add_argument('-m', '--mode', choices=['streaming', 'eager'], default='streaming',
+                      help='streaming: lazy columnar pipeline in bounded memory; eager: original row-by-row pipeline')
+    parser.add_argument('-b', '--batch-size', type=int, default=50_000,
+                      help='Rows per write batch in streaming mode')
+    parser.add_argument('-f', '--format', choices=list(OUTPUT_EXTENSIONS), default='json',
+                      help='Output format (parquet and arrow are only written in streaming mode)')
+    args = parser.parse_args()
+
+    if args.format != 'json' and args.mode == 'eager':
+        parser.error("--format parquet/arrow requires --mode streaming")
+    if args.format != 'json' and args.output == OUTPUT_FILE:
+        args.output = os.path.splitext(OUTPUT_FILE)[0] + OUTPUT_EXTENSIONS[args.format]
+
+    # Create output directory if it doesn't exist
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        if args.mode == 'streaming':
+            preprocess_streaming(args.input, args.output, args.batch_size, args.format)
+        else:
+            preprocess_eager(args.input, args.output)
+        logger.info("Successfully completed preprocessing!")
+    except Exception as e:
+        logger.error(f"Error during preprocessing: {str(e)}")
+        raise
+
+    # Verify the output
+    try:
+        verify_output(args.output)
+    except Exception as e:
+        logger.error(f"Error verifying output file: {str(e)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import time
+import numpy as np
+from collections import OrderedDict, defaultdict
+
+"""
+Semantic cache for GraphRAGQueryEngine.
+Queries are embedded with the same embedding model as the index, and a cached value is returned
+when a previous query's embedding has a cosine similarity above similarity_threshold. Values live
+in namespaces: final answers use the default namespace, while per-community intermediate answers
+use the community id, so near-duplicate queries can reuse the communities they have in common.
+Entries expire after ttl seconds, the least recently used ones are evicted past max_entries, and
+the whole cache is dropped whenever the graph store's communities change.
+"""
+class QueryCache():
+
+    def __init__(self, embed_model, similarity_threshold=0.95, ttl=3600, max_entries=1000):
+        self.embed_model = embed_model
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        # entry id -> (namespace, normalized embedding, value, creation time), in LRU order
+        self._entries = OrderedDict()
+        # namespace -> ids of the entries stored in it
+        self._namespaces = defaultdict(set)
+        self._next_id = 0
+
+    def embed(self, query_str):
+        """Returns the normalized float32 embedding used for lookups."""
+        embedding = np.asarray(self.embed_model.get_query_embedding(query_str), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def sync(self, version):
+        """Drop every entry if the communities have been rebuilt since the cache was filled."""
+        if version != self.version:
+            self.invalidate()
+            self.version = version
+
+    def invalidate(self):
+        self._entries.clear()
+        self._namespaces.clear()
+
+    def lookup(self, query_embedding, namespace=None):
+        """Returns the value cached for the most similar query in the namespace, or None."""
+        entry_ids = self._live_entry_ids(namespace)
+        if not entry_ids:
+            self.misses += 1
+            return None
+
+        matrix = np.stack([self._entries[entry_id][1] for entry_id in entry_ids])
+        scores = matrix @ query_embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry_id = entry_ids[best]
+        self._entries.move_to_end(entry_id)
+        return self._entries[entry_id][2]
+
+    def store(self, query_embedding, value, namespace=None):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (namespace, query_embedding, value, time.monotonic())
+        self._namespaces[namespace].add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _live_entry_ids(self, namespace):
+        """Ids stored in the namespace, removing the ones whose TTL has passed."""
+        now = time.monotonic()
+        entry_ids = []
+        for entry_id in list(self._namespaces.get(namespace, ())):
+            if now - self._entries[entry_id][3] > self.ttl:
+                self._remove(entry_id)
+            else:
+                entry_ids.append(entry_id)
+        return entry_ids
+
+    def _remove(self, entry_id):
+        namespace = self._entries.pop(entry_id)[0]
+        self._namespaces[namespace].discard(entry_id)
+        if not self._namespaces[namespace]:
+            del self._namespaces[namespace]
+
+    def __len__(self):
+        return len(self._entries)
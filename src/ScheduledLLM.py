@@ -0,0 +1,57 @@
+from typing import Any, Sequence
+from pydantic import PrivateAttr
+from llama_index.core.llms import LLM, LLMMetadata, ChatMessage, ChatResponse, CompletionResponse
+
+"""
+LLM wrapper that sends every call of the wrapped model through an LLMScheduler with a fixed
+priority. Components are handed one wrapper each (extraction, summaries, queries) and use it like any
+other llama_index LLM; the prompt formatting settings of the wrapped model are kept.
+"""
+class ScheduledLLM(LLM):
+    llm: LLM
+    priority: int
+    _scheduler: Any = PrivateAttr()
+
+    @classmethod
+    def create(cls, llm, scheduler, priority):
+        scheduled = cls(
+            llm=llm,
+            priority=priority,
+            system_prompt=llm.system_prompt,
+            messages_to_prompt=llm.messages_to_prompt,
+            completion_to_prompt=llm.completion_to_prompt,
+        )
+        scheduled._scheduler = scheduler
+        return scheduled
+
+    @classmethod
+    def class_name(cls):
+        return "ScheduledLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self.llm.metadata
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._scheduler.run(self.priority, self.llm.chat, messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._scheduler.run(self.priority, self.llm.complete, prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._scheduler.stream(self.priority, self.llm.stream_chat, messages, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._scheduler.stream(self.priority, self.llm.stream_complete, prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self._scheduler.arun(self.priority, self.llm.achat, messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self._scheduler.arun(self.priority, self.llm.acomplete, prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._scheduler.astream(self.priority, self.llm.astream_chat, messages, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._scheduler.astream(self.priority, self.llm.astream_complete, prompt, formatted=formatted, **kwargs)
@@ -0,0 +1,84 @@
+import time
+import threading
+
+"""
+Write buffer for graph upserts.
+Nodes and relations are collected in memory and handed to the write_nodes / write_relations
+callables in batches of batch_size, either when enough rows are buffered, when flush_interval
+seconds have passed since the last flush, or when flush() is called explicitly. Pending nodes are
+always written before pending relations, so a relation never reaches the store before its endpoints.
+The writers are plain callables, so the buffer works the same against Neo4j or an in-memory stand-in.
+"""
+class UpsertBuffer():
+
+    def __init__(self, write_nodes, write_relations, batch_size=5000, flush_interval=5.0):
+        self.write_nodes = write_nodes
+        self.write_relations = write_relations
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._nodes = []
+        self._relations = []
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+        self.nodes_written = 0
+        self.relations_written = 0
+        self.node_seconds = 0.0
+        self.relation_seconds = 0.0
+
+    @property
+    def pending(self):
+        return len(self._nodes) + len(self._relations)
+
+    def add_nodes(self, nodes):
+        with self._lock:
+            self._nodes.extend(nodes)
+            self._maybe_flush()
+
+    def add_relations(self, relations):
+        with self._lock:
+            self._relations.extend(relations)
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if (
+            len(self._nodes) >= self.batch_size
+            or len(self._relations) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write everything that is buffered, nodes first, in batches of batch_size."""
+        with self._lock:
+            nodes, self._nodes = self._nodes, []
+            relations, self._relations = self._relations, []
+            self._last_flush = time.monotonic()
+
+            start = time.perf_counter()
+            for index in range(0, len(nodes), self.batch_size):
+                self.write_nodes(nodes[index:index + self.batch_size])
+            if nodes:
+                self.node_seconds += time.perf_counter() - start
+                self.nodes_written += len(nodes)
+
+            start = time.perf_counter()
+            for index in range(0, len(relations), self.batch_size):
+                self.write_relations(relations[index:index + self.batch_size])
+            if relations:
+                self.relation_seconds += time.perf_counter() - start
+                self.relations_written += len(relations)
+
+    def reset_stats(self):
+        self.nodes_written = 0
+        self.relations_written = 0
+        self.node_seconds = 0.0
+        self.relation_seconds = 0.0
+
+    def report(self):
+        """Print the write throughput collected since the last reset."""
+        nodes_per_second = self.nodes_written / self.node_seconds if self.node_seconds else 0.0
+        relations_per_second = self.relations_written / self.relation_seconds if self.relation_seconds else 0.0
+        print(
+            f"Graph upserts: {self.nodes_written} nodes ({nodes_per_second:.0f} nodes/sec), "
+            f"{self.relations_written} relations ({relations_per_second:.0f} relations/sec)"
+        )
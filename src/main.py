@@ -9,26 +9,96 @@ def main():
 
     parser = argparse.ArgumentParser(description='Process research papers data')
     parser.add_argument('-j', '--json_path', type=str, default="datasets/arxiv_cs_metadata.json",
-                      help='Path to JSON file containing papers data')
+                      help='Path to the papers data (line-delimited .json, .parquet or .arrow)')
     parser.add_argument('-n', '--nrows', type=int, default=5,
                       help='Number of rows to read from JSON')
+    parser.add_argument('-o', '--offset', type=int, default=0,
+                      help='Number of rows to skip before reading')
+    parser.add_argument('--categories', type=str, nargs='+', default=None,
+                      help='Only read papers in these arXiv categories (e.g. cs.CL cs.LG)')
+    parser.add_argument('-b', '--batch-size', type=int, default=100,
+                      help='Papers extracted and inserted per checkpointed batch')
+    parser.add_argument('--no-resume', action='store_true',
+                      help='Ignore the ingestion checkpoint and start ingesting from the first paper')
+    parser.add_argument('--backend', type=str, choices=["neo4j", "memory"], default="neo4j",
+                      help='Graph store backend: a Neo4j server, or an in-process store snapshotted to disk')
+    parser.add_argument('--snapshot-path', type=str, default="cache/graph_snapshot.npz",
+                      help='Snapshot file of the in-memory backend (pass an empty string to keep it in memory only)')
     parser.add_argument('-d', '--database', type=str, default="neo4j",
                       help='Name of the database')
     parser.add_argument('-l', '--llm', type=str, default="qwen2.5",
                       help='Ollama Model name')
     parser.add_argument('-e', '--embed-model', type=str, default="avsolatorio/GIST-all-MiniLM-L6-v2",
                       help='HuggingFace Embedding Model Name')
+    parser.add_argument('-c', '--cache-path', type=str, default="cache/extractions.sqlite",
+                      help='Path to the on-disk extraction cache (pass an empty string to disable it)')
+    parser.add_argument('--embedding-cache', type=str, default="cache/embeddings",
+                      help='Directory of the on-disk embedding cache (pass an empty string to disable it)')
+    parser.add_argument('--vector-index', type=str, default=None,
+                      help='Directory of a local vector index over the entity embeddings, used for retrieval instead of the graph store')
+    parser.add_argument('-w', '--warm-start', action='store_true',
+                      help='Reuse the graph and community summaries already stored in the database')
+    parser.add_argument('-t', '--query-timeout', type=float, default=None,
+                      help='Seconds to wait for per-community answers before dropping the slow ones')
+    parser.add_argument('--no-stream-extraction', action='store_true',
+                      help='Wait for complete extraction responses instead of streaming them and stopping once enough relationships are parsed')
+    parser.add_argument('--extraction-batch-tokens', type=int, default=0,
+                      help='Pack several chunks into each extraction prompt, up to this many estimated tokens (0 extracts chunks one by one)')
+    parser.add_argument('--llm-concurrency', type=int, default=8,
+                      help='Maximum number of LLM calls in flight; the scheduler adapts the actual number to latency and errors')
+    parser.add_argument('--llm-timeout', type=float, default=600.0,
+                      help='Seconds before an LLM call is abandoned and retried')
+    parser.add_argument('--llm-endpoints', type=str, nargs='+', default=None,
+                      help='URLs of several Ollama servers running the model, to spread LLM calls across (e.g. http://gpu1:11434 http://gpu2:11434)')
+    parser.add_argument('--no-entity-resolution', action='store_true',
+                      help='Keep every entity name exactly as extracted instead of merging names of the same entity')
+    parser.add_argument('--max-communities', type=int, default=10,
+                      help='Max number of communities answered per query, the most similar to the query first')
+    parser.add_argument('--community-threshold', type=float, default=0.0,
+                      help='Min similarity between a query and a community summary for the community to be answered')
+    parser.add_argument('--no-global-search', action='store_true',
+                      help='Do not fall back to ranking every community when no entity matches the query')
+    parser.add_argument('--metrics-path', type=str, default=None,
+                      help='Collect per-stage timings and LLM call counts, and write them to this JSON file (and a .prom file next to it)')
+    parser.add_argument('--level', type=int, default=None,
+                      help='Community hierarchy level to build and query (0 is the coarsest, default: all levels)')
     
     args = parser.parse_args()
     
-    graph_rag = GraphRAG(args.json_path, args.nrows, args.database, args.llm, args.embed_model)
+    graph_rag = GraphRAG(
+        args.json_path, args.nrows, args.database, args.llm, args.embed_model,
+        cache_path=args.cache_path,
+        warm_start=args.warm_start,
+        query_timeout=args.query_timeout,
+        community_level=args.level,
+        offset=args.offset,
+        categories=args.categories,
+        batch_size=args.batch_size,
+        resume=not args.no_resume,
+        backend=args.backend,
+        snapshot_path=args.snapshot_path or None,
+        embedding_cache_dir=args.embedding_cache or None,
+        vector_index_path=args.vector_index,
+        metrics_path=args.metrics_path,
+        stream_extraction=not args.no_stream_extraction,
+        extraction_batch_tokens=args.extraction_batch_tokens,
+        llm_max_concurrency=args.llm_concurrency,
+        llm_timeout=args.llm_timeout,
+        llm_endpoints=args.llm_endpoints,
+        resolve_entities=not args.no_entity_resolution,
+        max_query_communities=args.max_communities,
+        community_threshold=args.community_threshold,
+        global_search=not args.no_global_search,
+    )
 
     while True:
         query_str = input("Enter a query, or 'exit' to quit: ")
         if query_str.lower() == "exit":
             print("Goodbye!")
             break
-        graph_rag.query(query_str)
+        for token in graph_rag.query(query_str, streaming=True):
+            print(token, end="", flush=True)
+        print()
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -23,14 +23,15 @@ st.set_page_config(
 )
 
 @st.cache_resource
-def get_graphrag(json_path, nrows, database, llm, embed_model):
+def get_graphrag(json_path, nrows, database, llm, embed_model, warm_start):
     with st.spinner('Setting up our GraphRAG. This might take a while...'):
         graph_rag = GraphRAG(
             json_path=json_path,
             nrows=nrows,
             database=database,
             llm=llm,
-            embed_model=embed_model
+            embed_model=embed_model,
+            warm_start=warm_start
         )
     return graph_rag
 
@@ -70,7 +71,8 @@ def main():
             'nrows': 5,
             'database': "neo4j",
             'llm': "qwen2.5",
-            'embed_model': "avsolatorio/GIST-all-MiniLM-L6-v2"
+            'embed_model': "avsolatorio/GIST-all-MiniLM-L6-v2",
+            'warm_start': False
         }
 
     if 'graph_rag' not in st.session_state:
@@ -108,13 +110,19 @@ def main():
             value=st.session_state.config['embed_model'],
             help="HuggingFace Embedding Model Name"
         )
+        new_warm_start = st.checkbox(
+            "Warm Start",
+            value=st.session_state.config['warm_start'],
+            help="Reuse the graph and community summaries already stored in the database"
+        )
         
         config_changed = (
             new_json_path != st.session_state.config['json_path'] or
             new_nrows != st.session_state.config['nrows'] or
             new_database != st.session_state.config['database'] or
             new_llm != st.session_state.config['llm'] or
-            new_embed_model != st.session_state.config['embed_model']
+            new_embed_model != st.session_state.config['embed_model'] or
+            new_warm_start != st.session_state.config['warm_start']
         )
         
         if config_changed:
@@ -128,7 +136,8 @@ def main():
                 'nrows': new_nrows,
                 'database': new_database,
                 'llm': new_llm,
-                'embed_model': new_embed_model
+                'embed_model': new_embed_model,
+                'warm_start': new_warm_start
             })
 
             st.session_state.graph_rag = get_graphrag(
@@ -136,7 +145,8 @@ def main():
                 st.session_state.config['nrows'],
                 st.session_state.config['database'],
                 st.session_state.config['llm'],
-                st.session_state.config['embed_model']
+                st.session_state.config['embed_model'],
+                st.session_state.config['warm_start']
             )
             st.success("GraphRAG initialized successfully!")
     
@@ -146,7 +156,8 @@ def main():
                 st.session_state.config['nrows'],
                 st.session_state.config['database'],
                 st.session_state.config['llm'],
-                st.session_state.config['embed_model']
+                st.session_state.config['embed_model'],
+                st.session_state.config['warm_start']
             )
     if st.session_state.graph_rag is not None:
         st.success("GraphRAG initialized successfully!")
@@ -162,10 +173,9 @@ def main():
         
         if st.button("Submit Query"):
             if query:
-                with st.spinner("Processing your query..."):
-                    response = st.session_state.graph_rag.query(query)
                 st.markdown("### Response")
-                st.markdown(response)
+                # Tokens are rendered as soon as the final aggregation starts streaming
+                st.write_stream(st.session_state.graph_rag.query(query, streaming=True))
                 st.caption(f"Query processed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
             else:
                 st.warning("Please enter a query first.")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules in src/ import each other by file name (from CommunityStore import CommunityStore)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,82 @@
+import pytest
+from EntityResolver import EntityResolver
+
+
+class SameEmbedding():
+    """Embeds every name identically, the worst case for the embedding confirmation."""
+
+    def get_text_embedding_batch(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+
+RESOLVERS = [EntityResolver(), EntityResolver(embed_model=SameEmbedding())]
+
+DISTINCT = [
+    ["Transformer", "Transformer-XL", "Transformers"],
+    ["Panda", "Pandas"],
+    ["ResNet-50", "ResNet-101", "ResNet-152"],
+    ["CIFAR-10", "CIFAR-100"],
+    ["Llama 2", "Llama 3"],
+    ["YOLOv5", "YOLOv8"],
+    ["GPT-3", "GPT-4"],
+    ["C", "C++", "C#"],
+    [".NET", "NET"],
+    ["A*", "A"],
+    ["pandas", "Panda"],
+]
+
+
+@pytest.mark.parametrize("resolver", RESOLVERS)
+@pytest.mark.parametrize("names", DISTINCT)
+def test_distinct_entities_are_not_merged(resolver, names):
+    assert resolver.resolve(names) == ({}, [])
+
+
+@pytest.mark.parametrize("resolver", RESOLVERS)
+def test_variants_are_merged(resolver):
+    names = [
+        "BERT", "Bert", "the BERT model",
+        "neural networks", "neural network",
+        "CNNs", "CNN",
+        "pre-training", "pretraining",
+        "GPT-3", "GPT3",
+    ]
+    groups, dropped = resolver.resolve(names)
+    assert groups == {
+        "BERT": ["Bert", "the BERT model"],
+        "neural network": ["neural networks"],
+        "CNN": ["CNNs"],
+        "pretraining": ["pre-training"],
+        "GPT3": ["GPT-3"],
+    }
+    assert dropped == []
+
+
+def test_kept_name_has_the_highest_degree():
+    groups, _ = EntityResolver().resolve(["BERT", "Bert"], degrees=[1, 5])
+    assert groups == {"Bert": ["BERT"]}
+
+
+def test_placeholders_are_dropped():
+    groups, dropped = EntityResolver().resolve(["DummyEntityName", "BERT"])
+    assert groups == {}
+    assert dropped == ["DummyEntityName"]
+
+
+@pytest.mark.parametrize("name, canonical", [
+    ("The Transformer", "transformer"),
+    ("Transformers", "transformers"),
+    ("Pandas", "pandas"),
+    ("pandas", "pandas"),
+    ("Graph Neural Networks", "graph neural network"),
+    ("LLMs", "llm"),
+    ("learned policies", "learned policy"),
+    ("regression analyses", "regression analysis"),
+    ("cross-entropy loss", "cross entropy loss"),
+    ("C++", "c++"),
+    (".NET", ".net"),
+    ("Node.js", "node js"),
+    ("snake_case", "snake case"),
+])
+def test_canonicalize(name, canonical):
+    assert EntityResolver.canonicalize(name) == canonical
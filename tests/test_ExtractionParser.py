@@ -0,0 +1,65 @@
+import pytest
+from ExtractionParser import ExtractionParser
+
+
+def test_records_are_parsed():
+    text = (
+        '("entity"$$$$BERT$$$$MODEL$$$$A language model.)\n'
+        '("entity"$$$$SQuAD$$$$DATASET$$$$A reading comprehension dataset.)\n'
+        '("relationship"$$$$BERT$$$$SQuAD$$$$evaluated_on$$$$BERT is evaluated on SQuAD.)'
+    )
+    entities, relationships = ExtractionParser.parse(text)
+    assert entities == [
+        ("BERT", "MODEL", "A language model."),
+        ("SQuAD", "DATASET", "A reading comprehension dataset."),
+    ]
+    assert relationships == [("BERT", "SQuAD", "evaluated_on", "BERT is evaluated on SQuAD.")]
+
+
+def test_descriptions_keep_their_parentheses():
+    text = '("entity"$$$$BERT$$$$MODEL$$$$A model (Devlin et al.) for text (and more).)\n'
+    entities, _ = ExtractionParser.parse(text)
+    assert entities == [("BERT", "MODEL", "A model (Devlin et al.) for text (and more).")]
+
+
+@pytest.mark.parametrize("trailer", [
+    "\nNote: these are all the entities (and relationships) I found (see above).",
+    "\n\nHope this helps (let me know if you need more).",
+    "##\n<|COMPLETE|> (done)",
+    "<|COMPLETE|>\nAll records (2 in total) are listed.",
+])
+def test_trailing_prose_is_not_part_of_the_last_record(trailer):
+    text = (
+        '("entity"$$$$BERT$$$$MODEL$$$$A language model.)\n'
+        '("relationship"$$$$BERT$$$$SQuAD$$$$evaluated_on$$$$BERT is evaluated on SQuAD (v1.1).)'
+        + trailer
+    )
+    entities, relationships = ExtractionParser.parse(text)
+    assert entities == [("BERT", "MODEL", "A language model.")]
+    assert relationships == [("BERT", "SQuAD", "evaluated_on", "BERT is evaluated on SQuAD (v1.1).")]
+
+
+def test_streamed_deltas_give_the_same_records():
+    text = (
+        '("entity"$$$$BERT$$$$MODEL$$$$A model (2018).)##'
+        '("entity"$$$$SQuAD$$$$DATASET$$$$A dataset.)\n'
+        '("relationship"$$$$BERT$$$$SQuAD$$$$evaluated_on$$$$BERT is evaluated on SQuAD.)<|COMPLETE|> (end)'
+    )
+    parser = ExtractionParser()
+    for i in range(0, len(text), 7):
+        parser.feed(text[i:i + 7])
+    assert parser.close() == ExtractionParser.parse(text)
+    assert ExtractionParser.parse(text)[0][0] == ("BERT", "MODEL", "A model (2018).")
+
+
+def test_incomplete_records_are_skipped():
+    text = '("entity"$$$$$$$$MODEL$$$$No name.)\n("relationship"$$$$BERT$$$$SQuAD)\n("entity"$$$$BERT$$$$MODEL$$$$Ok.)'
+    assert ExtractionParser.parse(text) == ([("BERT", "MODEL", "Ok.")], [])
+
+
+def test_generation_stops_at_max_relationships():
+    record = '("relationship"$$$$A$$$$B$$$$uses$$$$A uses B.)\n'
+    parser = ExtractionParser(max_relationships=2)
+    assert not parser.feed(record * 2)
+    assert parser.feed(record)
+    assert len(parser.close()[1]) == 2